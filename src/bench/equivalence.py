@@ -0,0 +1,130 @@
+import argparse
+import random
+import re
+from collections import Counter
+
+from src.bench.index import BENCH_SEED, make_response, make_tasks
+from src.task.index import TaskRunner, tokenizer
+from src.task.model import NIL_LABELS, TASK_TYPES, Task
+from src.tokenizer import TOKENIZATION_STRATEGIES, TokenizationStrategy
+
+EQUIVALENCE_TASKS = 250
+EQUIVALENCE_RESPONSES = 3
+
+
+# The evaluators as written before per-task artifacts were precomputed: every call re-derives everything from the task.
+def reference_evaluate(task: Task, strategy: TokenizationStrategy, response: str):
+    if task.type == "multiple_choice":
+        return reference_choice(task.options, task, strategy, response)
+    if task.type == "nli":
+        return reference_choice(NIL_LABELS, task, strategy, response)
+    if task.type == "extraction":
+        return max(
+            (reference_f1(tokenizer.normalize(response, strategy), tokenizer.normalize(str(gt), strategy)) for gt in task.ground_truths), default=0.0
+        )
+    if task.type == "correction":
+        return reference_correction(task, strategy, response)
+    if not response.strip().isdigit():
+        return 0.0
+    return max(
+        (max(0.0, 1.0 - abs(int(response.strip()) - int(gt)) / int(gt)) if int(gt) > 0 else (1.0 if int(response.strip()) == 0 else 0.0))
+        for gt in task.ground_truths
+    )
+
+
+def reference_choice(choices: list[str], task: Task, strategy: TokenizationStrategy, response: str):
+    return (
+        1.0
+        if any(
+            tokenizer.normalize(response, strategy) == tokenizer.normalize(choice, strategy) and choices.index(choice) in task.ground_truths
+            for choice in choices
+        )
+        else 0.0
+    )
+
+
+def reference_f1(prediction: str, ground_truth: str):
+    common = Counter(list(prediction)) & Counter(list(ground_truth))
+    num_same = sum(common.values())
+    if num_same == 0:
+        return 0.0
+    precision = 1.0 * num_same / len(prediction)
+    recall = 1.0 * num_same / len(ground_truth)
+    return (2 * precision * recall) / (precision + recall)
+
+
+def reference_correction(task: Task, strategy: TokenizationStrategy, response: str):
+    def normalize_part(text: str):
+        text = text.strip().replace("（", "(").replace("）", ")").replace("\u3000", " ")
+        text = text.strip("「」『』\"'`")
+        return tokenizer.normalize(text, strategy).lower()
+
+    def parse_pairs(text: str):
+        pairs: set[tuple[str, str]] = set()
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            if not line:
+                continue
+            if line.startswith("- "):
+                line = line[2:].strip()
+            line = re.sub(r"^\d+[.)]\s*", "", line)
+            match = re.compile(r"^(.+?)\s*->\s*(.+)$").match(line)
+            if not match:
+                continue
+            typo = normalize_part(match.group(1))
+            correction = normalize_part(match.group(2))
+            if typo and correction and typo != correction:
+                pairs.add((typo, correction))
+        return pairs
+
+    ground_truth_pairs = parse_pairs("\n".join(str(gt) for gt in task.ground_truths))
+    predicted_pairs = parse_pairs(response)
+    true_positives = len(predicted_pairs & ground_truth_pairs)
+    precision = true_positives / len(predicted_pairs) if predicted_pairs else (1.0 if not ground_truth_pairs else 0.0)
+    recall = true_positives / len(ground_truth_pairs) if ground_truth_pairs else 1.0
+    return (2 * precision * recall) / (precision + recall) if precision + recall > 0 else 0.0
+
+
+def perturb_response(task: Task, response: str, rng: random.Random):
+    # Formatting noise the evaluators are meant to tolerate or reject: padding, list markers, full-width brackets, quotes.
+    variants = [
+        response,
+        f" {response}\n",
+        "\n".join(f"{i + 1}. {line}" for i, line in enumerate(response.splitlines())),
+        "\n".join(f"- 「{line}」" for line in response.splitlines()),
+        response.replace("(", "（").replace(")", "）").upper(),
+        str(rng.randint(0, 20)) if task.type == "char_counting" else response[: rng.randint(0, len(response))],
+    ]
+    return rng.choice(variants)
+
+
+def check_equivalence(n_tasks: int, n_responses: int, seed: int = BENCH_SEED):
+    task_runner = TaskRunner()
+    rng = random.Random(seed)
+    cases = 0
+    mismatches: list[tuple[Task, TokenizationStrategy, str, float, float]] = []
+    for task_type in TASK_TYPES:
+        for task in make_tasks(task_type, n_tasks, seed):
+            for strategy in TOKENIZATION_STRATEGIES:
+                responses = [perturb_response(task, make_response(task, rng), rng) for _ in range(n_responses)]
+                for response, score in zip(responses, task_runner.evaluate_many(task, strategy, responses)):
+                    cases += 1
+                    expected = reference_evaluate(task, strategy, response)
+                    if score != expected or task_runner.evaluate(task, strategy, response) != expected:
+                        mismatches.append((task, strategy, response, score, expected))
+    return cases, mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the precomputed evaluators against the per-call reference evaluators")
+    parser.add_argument("--tasks", type=int, default=EQUIVALENCE_TASKS, help="Tasks per task type")
+    parser.add_argument("--responses", type=int, default=EQUIVALENCE_RESPONSES, help="Responses per (task, strategy)")
+    parser.add_argument("--seed", type=int, default=BENCH_SEED)
+    args = parser.parse_args()
+
+    cases, mismatches = check_equivalence(args.tasks, args.responses, args.seed)
+    for task, strategy, response, score, expected in mismatches[:10]:
+        print(f"{task.type} {task.id} [{strategy}] {response!r}: {score} != {expected}")
+    print(f"{cases - len(mismatches)}/{cases} (task, strategy, response) cases match the reference evaluators")
+    if mismatches:
+        raise SystemExit(1)
@@ -0,0 +1,327 @@
+import argparse
+import atexit
+import gc
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, cast
+
+from src.dataset.index import DatasetLoader
+from src.dataset.model import DatasetConfig
+from src.run.index import Runner
+from src.task.index import TaskRunner, evaluation_cache, tokenizer
+from src.task.model import NIL_LABELS, Task, TaskResult, TaskType
+from src.tokenizer import TOKENIZATION_STRATEGIES, TokenizationStrategy, Tokenizer
+
+BASELINE_FILE = Path(__file__).with_name("baseline.json")
+BENCH_THRESHOLD = float(os.getenv("BENCH_THRESHOLD", "0.3"))
+BENCH_REPEATS = int(os.getenv("BENCH_REPEATS", "5"))
+BENCH_SEED = 0
+CALIBRATION_KEY = "calibration"
+IMPORT_MODULE = "src.run.index"
+# Heavy dependencies the entry point must only load on the code paths that need them.
+LAZY_MODULES = ["datasets", "pyarrow", "fugashi", "ai_sdk", "openai"]
+
+SENTENCES = [
+    "東京は日本の首都であり、多くの企業の本社が集まっている。",
+    "明治維新の後、政府は近代的な制度を次々と導入した。",
+    "私は蝶が好きですが、蛾が嫌いです。",
+    "彼女は毎朝駅まで歩いて通勤している。",
+    "この地域では古くから米作りが盛んに行われてきた。",
+    "図書館で借りた本を返すのを忘れてしまった。",
+    "新しい研究によって、言語モデルの性能が大きく向上した。",
+    "山の上から見る景色は、言葉にできないほど美しかった。",
+    "会議は予定より一時間遅れて始まった。",
+    "猫が魚を食べた。",
+    "その作家は生涯で五十冊以上の小説を書いた。",
+    "雨が降りそうなので、傘を持って出かけることにした。",
+]
+
+
+@dataclass
+class Benchmark:
+    name: str
+    setup: Callable[[], Callable[[], Any]]
+    repeats: int = BENCH_REPEATS
+    # Whether the timing follows the calibration workload; interpreter start-up is dominated by disk and process creation, not Python speed.
+    scaled: bool = True
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    seconds: float
+    baseline: float | None
+    ratio: float | None
+    regressed: bool
+
+
+def make_text(rng: random.Random, n_sentences: int):
+    return "".join(rng.choice(SENTENCES) for _ in range(n_sentences))
+
+
+def make_tasks(task_type: TaskType, n: int, seed: int = BENCH_SEED):
+    rng = random.Random(seed)
+    tasks: list[Task] = []
+    for i in range(n):
+        if task_type == "multiple_choice":
+            options = [make_text(rng, 1)[:8] for _ in range(5)]
+            tasks.append(Task(str(i), task_type, None, make_text(rng, 1), options, [rng.randrange(5)]))
+        elif task_type == "nli":
+            tasks.append(Task(str(i), task_type, make_text(rng, 1), make_text(rng, 1), [], [rng.randrange(len(NIL_LABELS))]))
+        elif task_type == "extraction":
+            context = make_text(rng, 8)
+            start = rng.randrange(len(context) - 8)
+            tasks.append(Task(str(i), task_type, context, make_text(rng, 1), [], [context[start : start + 6]]))
+        elif task_type == "correction":
+            text = make_text(rng, 2)
+            tasks.append(
+                Task(str(i), task_type, None, text, [], [f"{text[j : j + 2]} -> {text[j + 1 : j + 3]}" for j in rng.sample(range(len(text) - 3), 2)])
+            )
+        else:
+            text = make_text(rng, 3)
+            character = rng.choice(text)
+            tasks.append(Task(str(i), task_type, text, character, [], [text.count(character)]))
+    return tasks
+
+
+def make_response(task: Task, rng: random.Random):
+    if task.type == "multiple_choice":
+        return rng.choice(task.options)
+    if task.type == "nli":
+        return rng.choice(NIL_LABELS)
+    if task.type == "extraction":
+        return str(task.ground_truths[0]) if rng.random() < 0.5 else (task.context or "")[:10]
+    if task.type == "correction":
+        return "\n".join(str(gt) for gt in task.ground_truths[: rng.randint(1, 2)])
+    return str(int(task.ground_truths[0]) + rng.randint(-1, 1))
+
+
+def bench_tokenize(strategy: TokenizationStrategy):
+    def setup():
+        rng = random.Random(BENCH_SEED)
+        # JSQuAD-sized contexts plus JWTD-sized sentences.
+        strings = [make_text(rng, 8) for _ in range(400)] + [make_text(rng, 2) for _ in range(2000)]
+        uncached = Tokenizer(max_workers=1, cache_size=0)
+        return lambda: [uncached.tokenize(s, strategy) for s in strings]
+
+    return Benchmark(f"tokenize[{strategy}]", setup)
+
+
+def bench_task_prompt(task_type: TaskType):
+    def setup():
+        task_runner = TaskRunner()
+        tasks = make_tasks(task_type, 2000)
+
+        def fn():
+            # Every repeat starts cold, so the timing includes tokenizing the task strings rather than only cache hits.
+            tokenizer.tokenize_cache.clear()
+            tokenizer.normalize_cache.clear()
+            return [task_runner.get_prompts(task, strategy) for task in tasks for strategy in TOKENIZATION_STRATEGIES]
+
+        return fn
+
+    return Benchmark(f"task_prompt[{task_type}]", setup)
+
+
+def bench_evaluate(task_type: TaskType):
+    def setup():
+        task_runner = TaskRunner()
+        rng = random.Random(BENCH_SEED)
+        tasks = make_tasks(task_type, 3000)
+        responses = [make_response(task, rng) for task in tasks]
+
+        def fn():
+            # Each task is evaluated once per repeat, so the per-task artifacts and normalized strings must be computed, not replayed.
+            evaluation_cache.clear()
+            tokenizer.tokenize_cache.clear()
+            tokenizer.normalize_cache.clear()
+            return [
+                task_runner.evaluate(task, strategy, response) for task, response in zip(tasks, responses) for strategy in TOKENIZATION_STRATEGIES
+            ]
+
+        return fn
+
+    return Benchmark(f"evaluate[{task_type}]", setup)
+
+
+def bench_load_tasks():
+    def setup():
+        rng = random.Random(BENCH_SEED)
+        directory = tempfile.mkdtemp(prefix="bench_")
+        atexit.register(shutil.rmtree, directory, ignore_errors=True)
+        path = Path(directory) / "jwtd.jsonl"
+        with open(path, "w", encoding="utf-8") as f:
+            for i in range(5000):
+                text = make_text(rng, 2)
+                row = {
+                    "category": "kanji-conversion",
+                    "page": str(i),
+                    "pre_rev": str(2 * i),
+                    "post_rev": str(2 * i + 1),
+                    "pre_text": text,
+                    "post_text": text,
+                    "diffs": [{"pre": text[:2], "post": text[1:3]}],
+                }
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+        loader = DatasetLoader()
+        jwtd = DatasetLoader.configs["JWTD"]
+        loader.configs = {**DatasetLoader.configs, "JWTD": DatasetConfig(path="json", name=str(path), transform=jwtd.transform, prepare=None)}
+        return lambda: list(loader.load_tasks("JWTD"))
+
+    return Benchmark("load_tasks[JWTD]", setup)
+
+
+def bench_calculate_summary():
+    def setup():
+        rng = random.Random(BENCH_SEED)
+        strategy_to_result_list: list[dict[TokenizationStrategy, TaskResult]] = [
+            {
+                strategy: TaskResult(
+                    task_id=str(i),
+                    task_type="char_counting",
+                    tokenization_strategy=strategy,
+                    task_prompt="",
+                    response="",
+                    ground_truths=[],
+                    dollars=rng.random() * 1e-4,
+                    evaluation=float(rng.random() < 0.5 + 0.1 * j),
+                    reasoning=None,
+                    latency_seconds=rng.random(),
+                    prompt_tokens=rng.randint(50, 500),
+                    completion_tokens=rng.randint(1, 10),
+                )
+                for j, strategy in enumerate(TOKENIZATION_STRATEGIES)
+            }
+            for i in range(10_000)
+        ]
+        runner = Runner()
+        return lambda: runner.calculate_summary(TOKENIZATION_STRATEGIES, strategy_to_result_list)
+
+    return Benchmark("calculate_summary[10k]", setup, repeats=3)
+
+
+def bench_import(module: str):
+    def setup():
+        # A fresh interpreter each time, since sys.modules would turn a second in-process import into a no-op.
+        command = [sys.executable, "-c", f"import {module}"]
+        return lambda: subprocess.run(command, check=True)
+
+    return Benchmark(f"import[{module}]", setup, scaled=False)
+
+
+def get_eager_imports(module: str):
+    code = f"import json, sys, {module}; print(json.dumps([m for m in {LAZY_MODULES!r} if m in sys.modules]))"
+    output = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout
+    return cast(list[str], json.loads(output))
+
+
+def get_benchmarks():
+    task_types: list[TaskType] = ["multiple_choice", "nli", "extraction", "correction", "char_counting"]
+    return [
+        *(bench_tokenize(strategy) for strategy in TOKENIZATION_STRATEGIES),
+        *(bench_task_prompt(task_type) for task_type in task_types),
+        *(bench_evaluate(task_type) for task_type in task_types),
+        bench_load_tasks(),
+        bench_calculate_summary(),
+        bench_import(IMPORT_MODULE),
+    ]
+
+
+def time_benchmark(benchmark: Benchmark):
+    fn = benchmark.setup()
+    fn()
+    timings: list[float] = []
+    # Like timeit, keep collector pauses triggered by earlier benchmarks out of the measurement.
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(benchmark.repeats):
+            start = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return min(timings)
+
+
+def calibrate():
+    # A fixed pure-Python workload; timings are compared relative to it so a slower machine or a noisy run does not read as a regression.
+    def fn():
+        counts: dict[str, int] = {}
+        for sentence in SENTENCES * 2000:
+            for character in sentence:
+                counts[character] = counts.get(character, 0) + 1
+        return counts
+
+    return time_benchmark(Benchmark(CALIBRATION_KEY, lambda: fn, repeats=BENCH_REPEATS))
+
+
+def load_baseline(path: Path) -> dict[str, float]:
+    if not path.exists():
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_benchmarks(benchmarks: list[Benchmark], baseline: dict[str, float], threshold: float, calibration: float):
+    scale = calibration / baseline[CALIBRATION_KEY] if baseline.get(CALIBRATION_KEY) else 1.0
+    print(f"{CALIBRATION_KEY}: {calibration * 1000:.2f} ms (x{scale:.2f} of baseline machine speed)")
+
+    results: list[BenchmarkResult] = []
+    for benchmark in benchmarks:
+        base = baseline.get(benchmark.name)
+        expected = base * scale if base and benchmark.scaled else base
+        seconds = time_benchmark(benchmark)
+        if expected and seconds / expected > 1 + threshold:
+            # Confirm a suspected regression with a second measurement before reporting it.
+            seconds = min(seconds, time_benchmark(benchmark))
+        ratio = seconds / expected if expected else None
+        results.append(
+            BenchmarkResult(name=benchmark.name, seconds=seconds, baseline=base, ratio=ratio, regressed=ratio is not None and ratio > 1 + threshold)
+        )
+        status = "REGRESSED" if results[-1].regressed else "ok"
+        comparison = f" (baseline {base * 1000:.2f} ms, x{ratio:.2f})" if base and ratio else ""
+        print(f"{benchmark.name}: {seconds * 1000:.2f} ms{comparison} {status}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the CPU-side hot paths of the harness against a stored baseline")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_FILE, help="Baselines are machine specific; refresh them with --update")
+    parser.add_argument("--update", action="store_true", help="Write the measured timings as the new baseline")
+    parser.add_argument("--threshold", type=float, default=BENCH_THRESHOLD, help="Allowed slowdown before a benchmark counts as regressed")
+    parser.add_argument("--only", nargs="*", default=[], help="Run only benchmarks whose name contains one of these substrings")
+    parser.add_argument("--output", type=Path, help="Also write the results as JSON")
+    args = parser.parse_args()
+
+    benchmarks = [b for b in get_benchmarks() if not args.only or any(pattern in b.name for pattern in args.only)]
+    baseline = load_baseline(args.baseline)
+    calibration = calibrate()
+    results = run_benchmarks(benchmarks, {} if args.update else baseline, args.threshold, calibration)
+    eager_imports = get_eager_imports(IMPORT_MODULE)
+    if eager_imports:
+        print(f"import[{IMPORT_MODULE}] eagerly loads {', '.join(eager_imports)}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump([asdict(r) for r in results], f, indent=4)
+
+    if args.update:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**baseline, CALIBRATION_KEY: calibration, **{r.name: r.seconds for r in results}}, f, indent=4)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+    elif any(r.regressed for r in results):
+        raise SystemExit(f"{sum(r.regressed for r in results)} benchmark(s) regressed by more than {args.threshold:.0%}")
+    if eager_imports:
+        raise SystemExit(f"Importing {IMPORT_MODULE} must not load {', '.join(eager_imports)}")
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+from collections.abc import Iterable
+from pathlib import Path
+from types import CodeType
+from typing import Any, cast
+
+import pyarrow as pa
+
+from src.dataset.model import DatasetConfig
+from src.task.model import Task
+
+CACHE_DIR = Path("data/cache")
+CACHE_VERSION = "1"
+
+TASK_SCHEMA = pa.schema(
+    [
+        ("id", pa.string()),
+        ("type", pa.string()),
+        ("context", pa.string()),
+        ("question", pa.string()),
+        ("options", pa.list_(pa.string())),
+        ("ground_truths", pa.string()),
+    ]
+)
+
+
+def get_code_fingerprint(code: CodeType) -> str:
+    consts = [get_code_fingerprint(c) if isinstance(c, CodeType) else repr(c) for c in code.co_consts]
+    return hashlib.sha256("\0".join([code.co_code.hex(), *consts, *code.co_names]).encode("utf-8")).hexdigest()
+
+
+def get_config_fingerprint(config: DatasetConfig[Any]):
+    if config.path == "json":
+        stat = Path(config.name).stat()
+        source = f"{config.name}:{stat.st_size}:{stat.st_mtime_ns}"
+    else:
+        source = f"{config.path}:{config.name}:{config.revision}"
+    transform = get_code_fingerprint(cast(CodeType, getattr(config.transform, "__code__")))
+    return hashlib.sha256(f"{CACHE_VERSION}:{source}:{transform}".encode("utf-8")).hexdigest()
+
+
+class TaskTable:
+    def __init__(self, table: pa.Table, fingerprint: str):
+        self.table = table
+        self.fingerprint = fingerprint
+        self._id_to_index: dict[str, int] | None = None
+
+    def __len__(self):
+        return self.table.num_rows
+
+    def __getitem__(self, index: int):
+        return self.get_tasks([index])[0]
+
+    def get_tasks(self, indices: list[int]):
+        return [
+            Task(
+                id=row["id"],
+                type=row["type"],
+                context=row["context"],
+                question=row["question"],
+                options=row["options"],
+                ground_truths=json.loads(row["ground_truths"]),
+            )
+            for row in self.table.take(indices).to_pylist()
+        ]
+
+    def get_tasks_by_id(self, ids: list[str]):
+        if self._id_to_index is None:
+            self._id_to_index = {task_id: i for i, task_id in enumerate(self.table.column("id").to_pylist())}
+        return self.get_tasks([self._id_to_index[task_id] for task_id in ids])
+
+
+def write_task_table(path: Path, fingerprint: str, tasks: Iterable[Task]):
+    rows = [
+        {
+            "id": task.id,
+            "type": task.type,
+            "context": task.context,
+            "question": task.question,
+            "options": task.options,
+            "ground_truths": json.dumps(task.ground_truths, ensure_ascii=False),
+        }
+        for task in tasks
+    ]
+    table = pa.Table.from_pylist(rows, schema=TASK_SCHEMA.with_metadata({"fingerprint": fingerprint}))
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Per-process, so two runs building the same table cannot interleave writes into one temporary file.
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    with pa.OSFile(str(tmp_path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    tmp_path.replace(path)
+
+
+def read_task_table(path: Path, fingerprint: str):
+    if not path.exists():
+        return None
+    table = pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+    metadata = table.schema.metadata or {}
+    if metadata.get(b"fingerprint") != fingerprint.encode("utf-8"):
+        return None
+    return TaskTable(table, fingerprint)
@@ -1,44 +1,60 @@
+import bisect
 import json
 import random
 import re
+from collections.abc import Iterable, Iterator
 from pathlib import Path
+from typing import TypeVar
+
+import numpy as np
 
 from src.dataset.jwtd import prepare_jwtd
-from src.dataset.model import CharCount
+from src.dataset.model import CHAR_COUNT_SWEEP_NAMES, CharCount
 
 DATA_DIR = Path("data/char_count")
 OUTPUT_FILE = DATA_DIR / "test.jsonl"
 JWTD_FILE = Path("data/jwtd/test.jsonl")
 ID_PREFIX = "char_count_wiki"
+MIN_SENTENCE_LENGTH = 20
+TARGET_CHARS = ["が", "は", "を", "に", "の", "も", "た", "て", "だ", "る", "。", "、", "日", "本", "学", "者"]
+SWEEP_LENGTHS = [int(name.removeprefix("CharCount_")) for name in CHAR_COUNT_SWEEP_NAMES]
 
+T = TypeVar("T")
 
-def generate_char_count_dataset(n_samples: int, target_length: int, length_variance: float, target_chars: list[str]):
-    samples: list[CharCount] = []
-    prepare_jwtd()
 
+def iter_jwtd_texts() -> Iterator[str]:
     with open(JWTD_FILE, "r", encoding="utf-8") as f:
-        jwtd_lines = f.readlines()
+        for line in f:
+            data = json.loads(line)
+            yield re.sub(r"\s+", " ", data["pre_text"]).strip()
 
-    random.shuffle(jwtd_lines)
 
-    min_len = int(target_length * (1 - length_variance))
-    max_len = int(target_length * (1 + length_variance))
+def reservoir_sample(items: Iterable[T], k: int, rng: random.Random):
+    reservoir: list[T] = []
+    for i, item in enumerate(items):
+        if i < k:
+            reservoir.append(item)
+        else:
+            j = rng.randint(0, i)
+            if j < k:
+                reservoir[j] = item
+    rng.shuffle(reservoir)
+    return reservoir
 
+
+def build_char_count_samples(texts: list[str], n_samples: int, min_len: int, max_len: int, target_chars: list[str], rng: random.Random):
+    samples: list[CharCount] = []
     count = 0
     current_block = ""
-    for line in jwtd_lines:
+    for text in texts:
         if count >= n_samples:
             break
 
-        data = json.loads(line)
-        text = data["pre_text"]
-        text = re.sub(r"\s+", " ", text).strip()
-
         if len(current_block) + len(text) <= max_len:
             current_block += text
         else:
             if len(current_block) >= min_len:
-                character = random.choice(target_chars)
+                character = rng.choice(target_chars)
                 samples.append(
                     {
                         "id": f"{ID_PREFIX}_{count}",
@@ -51,7 +67,7 @@ def generate_char_count_dataset(n_samples: int, target_length: int, length_varia
             current_block = text
 
     if count < n_samples and len(current_block) >= min_len:
-        character = random.choice(target_chars)
+        character = rng.choice(target_chars)
         samples.append(
             {
                 "id": f"{ID_PREFIX}_{count}",
@@ -60,6 +76,26 @@ def generate_char_count_dataset(n_samples: int, target_length: int, length_varia
                 "count": current_block.count(character),
             }
         )
+    return samples
+
+
+def generate_char_count_dataset(n_samples: int, target_length: int, length_variance: float, target_chars: list[str], seed: int = 0):
+    prepare_jwtd()
+
+    min_len = int(target_length * (1 - length_variance))
+    max_len = int(target_length * (1 + length_variance))
+
+    size = n_samples * max(1, max_len // MIN_SENTENCE_LENGTH)
+    while True:
+        rng = random.Random(seed)
+        texts = reservoir_sample(iter_jwtd_texts(), size, rng)
+        samples = build_char_count_samples(texts, n_samples, min_len, max_len, target_chars, rng)
+        # Sentences that overshoot a block are skipped, so the reservoir grows until it fills n_samples or holds the whole source.
+        if len(samples) >= n_samples or len(texts) < size:
+            break
+        size *= 2
+    if len(samples) < n_samples:
+        print(f"Warning: JWTD only yields {len(samples)} of {n_samples} CharCount samples of {min_len}-{max_len} characters")
 
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
@@ -74,6 +110,79 @@ def prepare_char_count():
             500,
             150,
             0.2,
-            ["が", "は", "を", "に", "の", "も", "た", "て", "だ", "る", "。", "、", "日", "本", "学", "者"],
+            TARGET_CHARS,
         )
         print(f"CharCount dataset generated at {OUTPUT_FILE}")
+
+
+def get_sweep_file(target_length: int):
+    return DATA_DIR / f"length_{target_length}.jsonl"
+
+
+class SentenceIndex:
+    def __init__(self, texts: list[str], target_chars: list[str]):
+        self.texts = texts
+        self.target_chars = target_chars
+        # Prefix sums over the sentence order: texts[i:j] is lengths[j] - lengths[i] long and contains counts[j] - counts[i] of each target char.
+        self.lengths = [0]
+        for text in texts:
+            self.lengths.append(self.lengths[-1] + len(text))
+        self.counts = np.zeros((len(texts) + 1, len(target_chars)), dtype=np.int64)
+        self.counts[1:] = np.cumsum([[text.count(c) for c in target_chars] for text in texts], axis=0)
+
+    def get_block_end(self, start: int, min_len: int, max_len: int, rng: random.Random):
+        offset = self.lengths[start]
+        goal = offset + rng.randint(min_len, max_len)
+        end = bisect.bisect_left(self.lengths, goal, lo=start + 1)
+        for candidate in (end, end - 1):
+            if start < candidate < len(self.lengths) and min_len <= self.lengths[candidate] - offset <= max_len:
+                return candidate
+        return None
+
+    def iter_blocks(self, min_len: int, max_len: int, rng: random.Random):
+        start = 0
+        while start < len(self.texts):
+            end = self.get_block_end(start, min_len, max_len, rng)
+            if end is None:
+                start += 1
+                continue
+            yield start, end
+            start = end
+
+
+def generate_char_count_sweep(n_samples: int, target_lengths: list[int], length_variance: float, target_chars: list[str], seed: int = 0):
+    prepare_jwtd()
+    texts = [text for text in iter_jwtd_texts() if text]
+    random.Random(seed).shuffle(texts)
+    index = SentenceIndex(texts, target_chars)
+
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    for target_length in target_lengths:
+        rng = random.Random(f"{seed}_{target_length}")
+        min_len = int(target_length * (1 - length_variance))
+        max_len = int(target_length * (1 + length_variance))
+
+        samples: list[CharCount] = []
+        for start, end in index.iter_blocks(min_len, max_len, rng):
+            if len(samples) >= n_samples:
+                break
+            k = rng.randrange(len(target_chars))
+            samples.append(
+                {
+                    "id": f"{ID_PREFIX}_{target_length}_{len(samples)}",
+                    "text": "".join(texts[start:end]),
+                    "character": target_chars[k],
+                    "count": int(index.counts[end, k] - index.counts[start, k]),
+                }
+            )
+
+        with open(get_sweep_file(target_length), "w", encoding="utf-8") as f:
+            for sample in samples:
+                f.write(json.dumps(sample, ensure_ascii=False) + "\n")
+        print(f"CharCount length {target_length}: {len(samples)} samples at {get_sweep_file(target_length)}")
+
+
+def prepare_char_count_sweep():
+    if not all(get_sweep_file(target_length).exists() for target_length in SWEEP_LENGTHS):
+        print("Generating CharCount length sweep from JWTD...")
+        generate_char_count_sweep(500, SWEEP_LENGTHS, 0.2, TARGET_CHARS)
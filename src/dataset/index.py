@@ -1,22 +1,26 @@
 import json
 import os
-from typing import Any, cast
+import random
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, cast
 
-from datasets.combine import concatenate_datasets
-from datasets.dataset_dict import DatasetDict
-from datasets.load import load_dataset
-from datasets.utils.logging import set_verbosity_error
 from dotenv import load_dotenv
 
-from src.dataset.char_count import prepare_char_count
+from src.dataset.char_count import get_sweep_file, prepare_char_count, prepare_char_count_sweep
 from src.dataset.jwtd import prepare_jwtd
-from src.dataset.model import JNLI, CharCount, DatasetConfig, DatasetName, JCommonsenseQA, JSQuADT, WikipediaTypo
+from src.dataset.model import CHAR_COUNT_SWEEP_NAMES, JNLI, CharCount, DatasetConfig, DatasetName, JCommonsenseQA, JSQuADT, WikipediaTypo
 from src.task.model import Task
 
+if TYPE_CHECKING:
+    from datasets.arrow_dataset import Dataset
+
+    from src.dataset.cache import TaskTable
+
 load_dotenv()
-set_verbosity_error()
 
 os.environ["HF_DATASETS_TRUST_REMOTE_CODE"] = "1"
+# A hub commit or tag; pinning it keeps the sampled tasks, and the task cache keyed on it, stable when the dataset is updated upstream.
+JGLUE_REVISION = os.getenv("JGLUE_REVISION") or None
 
 
 class DatasetLoader:
@@ -33,6 +37,7 @@ class DatasetLoader:
                 ground_truths=[r["label"]],
             ),
             prepare=None,
+            revision=JGLUE_REVISION,
         ),
         "JNLI": DatasetConfig[JNLI](
             path="shunk031/JGLUE",
@@ -41,6 +46,7 @@ class DatasetLoader:
                 id=r["sentence_pair_id"], type="nli", context=r["sentence1"], question=r["sentence2"], options=[], ground_truths=[r["label"]]
             ),
             prepare=None,
+            revision=JGLUE_REVISION,
         ),
         "JSQuAD": DatasetConfig[JSQuADT](
             path="shunk031/JGLUE",
@@ -49,6 +55,7 @@ class DatasetLoader:
                 id=r["id"], type="extraction", context=r["context"], question=r["question"], options=[], ground_truths=r["answers"]["text"]
             ),
             prepare=None,
+            revision=JGLUE_REVISION,
         ),
         "JWTD": DatasetConfig[WikipediaTypo](
             path="json",
@@ -71,8 +78,23 @@ class DatasetLoader:
                 id=r["id"], type="char_counting", context=r["text"], question=r["character"], options=[], ground_truths=[r["count"]]
             ),
         ),
+        **{
+            name: DatasetConfig[CharCount](
+                path="json",
+                name=str(get_sweep_file(int(name.removeprefix("CharCount_")))),
+                prepare=prepare_char_count_sweep,
+                transform=lambda r: Task(
+                    id=r["id"], type="char_counting", context=r["text"], question=r["character"], options=[], ground_truths=[r["count"]]
+                ),
+            )
+            for name in CHAR_COUNT_SWEEP_NAMES
+        },
     }
 
+    line_offsets: dict[tuple[str, int, int], list[int]] = {}
+    task_tables: dict[DatasetName, "TaskTable"] = {}
+    use_cache = os.getenv("DATASET_CACHE", "on") != "off"
+
     def load_raw(self, dataset_name: DatasetName):
         config = self.configs[dataset_name]
         if config.prepare:
@@ -82,7 +104,17 @@ class DatasetLoader:
             with open(config.name, "r", encoding="utf-8") as f:
                 return [json.loads(line) for line in f]
 
-        dataset = cast(DatasetDict, load_dataset(config.path, config.name, trust_remote_code=True))
+        return self.load_hf(config)
+
+    def load_hf(self, config: DatasetConfig[Any]) -> "Dataset":
+        # HF datasets pulls in pandas and the hub client; JSON-backed datasets never need it.
+        from datasets.combine import concatenate_datasets
+        from datasets.dataset_dict import DatasetDict
+        from datasets.load import load_dataset
+        from datasets.utils.logging import set_verbosity_error
+
+        set_verbosity_error()
+        dataset = cast(DatasetDict, load_dataset(config.path, config.name, revision=config.revision, trust_remote_code=True))
         return concatenate_datasets([dataset["train"], dataset["validation"]])
 
     def load_tasks(self, dataset: DatasetName):
@@ -90,6 +122,66 @@ class DatasetLoader:
         for row in self.load_raw(dataset):
             yield config.transform(row)
 
+    def get_line_offsets(self, path: str):
+        stat = Path(path).stat()
+        key = (path, stat.st_size, stat.st_mtime_ns)
+        if key not in self.line_offsets:
+            offsets: list[int] = []
+            offset = 0
+            with open(path, "rb") as f:
+                for line in f:
+                    if line.strip():
+                        offsets.append(offset)
+                    offset += len(line)
+            self.line_offsets[key] = offsets
+        return self.line_offsets[key]
+
+    @staticmethod
+    def sample_indices(length: int, n: int, seed: int):
+        indices = list(range(length))
+        random.Random(seed).shuffle(indices)
+        return indices[:n]
+
+    def load_task_table(self, dataset_name: DatasetName):
+        from src.dataset.cache import CACHE_DIR, TaskTable, get_config_fingerprint, read_task_table, write_task_table
+
+        config = self.configs[dataset_name]
+        if config.prepare:
+            config.prepare()
+
+        fingerprint = get_config_fingerprint(config)
+        table = self.task_tables.get(dataset_name)
+        if table is None or table.fingerprint != fingerprint:
+            path = CACHE_DIR / f"{dataset_name}.arrow"
+            table = read_task_table(path, fingerprint)
+            if table is None:
+                print(f"Building task cache for {dataset_name} at {path}...")
+                write_task_table(path, fingerprint, self.load_tasks(dataset_name))
+                table = read_task_table(path, fingerprint)
+            self.task_tables[dataset_name] = cast(TaskTable, table)
+        return self.task_tables[dataset_name]
+
+    def sample_tasks(self, dataset_name: DatasetName, n: int, seed: int = 0):
+        if self.use_cache:
+            table = self.load_task_table(dataset_name)
+            return table.get_tasks(self.sample_indices(len(table), n, seed))
+
+        config = self.configs[dataset_name]
+        if config.prepare:
+            config.prepare()
+
+        if config.path == "json":
+            offsets = self.get_line_offsets(config.name)
+            rows: list[Any] = []
+            with open(config.name, "rb") as f:
+                for index in self.sample_indices(len(offsets), n, seed):
+                    f.seek(offsets[index])
+                    rows.append(json.loads(f.readline()))
+            return [config.transform(row) for row in rows]
+
+        dataset = self.load_hf(config)
+        return [config.transform(row) for row in dataset.select(self.sample_indices(len(dataset), n, seed))]
+
 
 if __name__ == "__main__":
     loader = DatasetLoader()
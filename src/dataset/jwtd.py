@@ -1,53 +1,58 @@
+import os
 import shutil
 import tarfile
 import urllib.request
 from pathlib import Path
+from typing import IO
 
 JWTD_URL = "https://nlp.ist.i.kyoto-u.ac.jp/nl-resource/JWTD/jwtd.tar.gz"
+JWTD_MEMBERS = ["test.jsonl"]
 DATA_DIR = Path("data/jwtd")
 
 
-def prepare_jwtd():
-    target_file = DATA_DIR / "test.jsonl"
-    alt_target_file = DATA_DIR / "jwtd" / "test.jsonl"
+def open_jwtd_source(source: str) -> IO[bytes]:
+    if Path(source).exists():
+        return open(source, "rb")
+    return urllib.request.urlopen(source)
 
-    if target_file.exists() or alt_target_file.exists():
+
+def prepare_jwtd(source: str | None = None):
+    targets = {name: DATA_DIR / name for name in JWTD_MEMBERS}
+    for name, target in targets.items():
+        # Archives extracted by hand keep the top-level jwtd/ directory.
+        nested = DATA_DIR / "jwtd" / name
+        if not target.exists() and nested.exists():
+            nested.replace(target)
+    if all(target.exists() for target in targets.values()):
         return
 
-    print(f"JWTD not found. Downloading from {JWTD_URL}...")
+    source = source or os.getenv("JWTD_SOURCE", JWTD_URL)
+    print(f"JWTD not found. Streaming {', '.join(JWTD_MEMBERS)} from {source}...")
     DATA_DIR.mkdir(parents=True, exist_ok=True)
-    tar_path = DATA_DIR / "jwtd.tar.gz"
-
-    try:
-        urllib.request.urlretrieve(JWTD_URL, tar_path)
-    except Exception as e:
-        print(f"Failed to download dataset: {e}")
-        if tar_path.exists():
-            tar_path.unlink()
-        raise
 
-    print("Extracting JWTD...")
     try:
-        with tarfile.open(tar_path, "r:gz") as tar:
-            tar.extractall(path=DATA_DIR)
-
-        subdir = DATA_DIR / "jwtd"
-        if subdir.exists() and subdir.is_dir():
-            for item in subdir.iterdir():
-                destination = DATA_DIR / item.name
-                if destination.exists():
-                    if destination.is_dir():
-                        shutil.rmtree(destination)
-                    else:
-                        destination.unlink()
-                shutil.move(str(item), str(DATA_DIR))
-            subdir.rmdir()
+        with open_jwtd_source(source) as stream, tarfile.open(fileobj=stream, mode="r|gz") as tar:
+            for member in tar:
+                name = Path(member.name).name
+                if not member.isfile() or name not in targets or targets[name].exists():
+                    continue
+
+                extracted = tar.extractfile(member)
+                if extracted is None:
+                    continue
+                tmp_path = targets[name].with_suffix(".tmp")
+                with extracted, open(tmp_path, "wb") as f:
+                    shutil.copyfileobj(extracted, f)
+                tmp_path.replace(targets[name])
 
     except Exception as e:
-        print(f"Failed to extract dataset: {e}")
+        print(f"Failed to prepare dataset: {e}")
+        for target in targets.values():
+            target.with_suffix(".tmp").unlink(missing_ok=True)
         raise
-    finally:
-        if tar_path.exists():
-            tar_path.unlink()
+
+    missing = [name for name, target in targets.items() if not target.exists()]
+    if missing:
+        raise FileNotFoundError(f"JWTD source {source} does not contain {', '.join(missing)}")
 
     print("JWTD preparation complete.")
@@ -1,11 +1,16 @@
 from collections.abc import Callable
 from dataclasses import dataclass
-from typing import Generic, Literal, TypedDict, TypeVar
+from typing import Generic, Literal, TypedDict, TypeVar, get_args
 
 from src.task.model import Task
 
-DatasetName = Literal["JCommonsenseQA", "JNLI", "JSQuAD", "JWTD", "CharCount"]
-DATASET_NAMES: list[DatasetName] = ["JCommonsenseQA", "JNLI", "JSQuAD", "JWTD", "CharCount"]
+# Each CharCount_<length> variant is generated at that target length by src.dataset.char_count.
+CharCountSweepName = Literal[
+    "CharCount_25", "CharCount_50", "CharCount_100", "CharCount_150", "CharCount_200", "CharCount_300", "CharCount_500", "CharCount_800"
+]
+DatasetName = Literal["JCommonsenseQA", "JNLI", "JSQuAD", "JWTD", "CharCount", CharCountSweepName]
+CHAR_COUNT_SWEEP_NAMES: list[CharCountSweepName] = list(get_args(CharCountSweepName))
+DATASET_NAMES: list[DatasetName] = ["JCommonsenseQA", "JNLI", "JSQuAD", "JWTD", "CharCount", *CHAR_COUNT_SWEEP_NAMES]
 
 T = TypeVar("T")
 
@@ -16,6 +21,7 @@ class DatasetConfig(Generic[T]):
     name: str
     transform: Callable[[T], Task]
     prepare: Callable[[], None] | None
+    revision: str | None = None
 
 
 class JCommonsenseQA(TypedDict):
@@ -0,0 +1,428 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from email.message import EmailMessage
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, cast
+
+import numpy as np
+
+from src.rate_limiter import RATE_LIMIT_WINDOW_SECONDS
+
+CHOICES_PATTERN = re.compile(r"Choices:\n(.+)$", flags=re.DOTALL)
+TEXT_PATTERN = re.compile(r"^(?:Text|Context): (.*)$", flags=re.MULTILINE)
+CHARACTER_PATTERN = re.compile(r"^Character: (.*)$", flags=re.MULTILINE)
+BATCH_PATH_PATTERN = re.compile(r"/batches/([\w-]+)$")
+FILE_CONTENT_PATH_PATTERN = re.compile(r"/files/([\w-]+)/content$")
+
+
+@dataclass
+class MockConfig:
+    latency_median: float = 0.5
+    latency_sigma: float = 0.5
+    rpm: int = 0
+    rate_limit_probability: float = 0.0
+    accuracy: float = 0.8
+    chatty_tokens: int = 0
+    prompt_price: float = 0.1
+    completion_price: float = 0.4
+    batch_seconds: float = 1.0
+    batch_discount: float = 0.5
+    seed: int = 0
+
+
+@dataclass
+class MockStats:
+    started_at: float = field(default_factory=time.monotonic)
+    requests: int = 0
+    completed: int = 0
+    cancelled: int = 0
+    rate_limited: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+    latencies: list[float] = field(default_factory=list)
+
+
+class MockProvider:
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.stats = MockStats()
+        self._rng = random.Random(config.seed)
+        self._windows: dict[str, tuple[int, int]] = {}
+        self._seen_prefixes: set[str] = set()
+        self.files: dict[str, bytes] = {}
+        self.batches: dict[str, dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get_latency(self):
+        with self._lock:
+            return self.config.latency_median * float(np.exp(self.config.latency_sigma * self._rng.gauss(0, 1)))
+
+    def check_rate_limit(self, model: str):
+        with self._lock:
+            if self.config.rate_limit_probability and self._rng.random() < self.config.rate_limit_probability:
+                return {"X-RateLimit-Limit": str(self.config.rpm)} if self.config.rpm else {}
+            if not self.config.rpm:
+                return None
+
+            window = int(time.time() // RATE_LIMIT_WINDOW_SECONDS)
+            current, count = self._windows.get(model, (window, 0))
+            count = count + 1 if current == window else 1
+            self._windows[model] = (window, count)
+            if count <= self.config.rpm:
+                return None
+            reset_ms = int((window + 1) * RATE_LIMIT_WINDOW_SECONDS * 1000)
+            return {"X-RateLimit-Limit": str(self.config.rpm), "X-RateLimit-Remaining": "0", "X-RateLimit-Reset": str(reset_ms)}
+
+    def get_cached_tokens(self, system: str | None):
+        if not system:
+            return 0
+        key = hashlib.sha256(system.encode("utf-8")).hexdigest()
+        with self._lock:
+            seen = key in self._seen_prefixes
+            self._seen_prefixes.add(key)
+        return len(system) if seen else 0
+
+    @staticmethod
+    def get_field(pattern: re.Pattern[str], prompt: str):
+        match = pattern.search(prompt)
+        return match.group(1).replace(" ", "") if match else ""
+
+    def get_answer(self, prompt: str):
+        # Answers depend only on the prompt, so repeated runs over the same tasks are reproducible.
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        correct = rng.random() < self.config.accuracy
+
+        if "Count the number of" in prompt:
+            text = self.get_field(TEXT_PATTERN, prompt)
+            character = self.get_field(CHARACTER_PATTERN, prompt)
+            count = text.count(character) if character else 0
+            return str(count if correct else max(0, count + rng.choice([-1, 1])))
+        if choices := CHOICES_PATTERN.search(prompt):
+            return rng.choice(choices[1].strip().splitlines())
+        if "Extract the answer" in prompt:
+            context = self.get_field(TEXT_PATTERN, prompt)
+            start = rng.randrange(max(1, len(context) - 6))
+            return context[start : start + 6]
+        if "typo-correction" in prompt:
+            text = self.get_field(TEXT_PATTERN, prompt)
+            start = rng.randrange(max(1, len(text) - 2))
+            return f"{text[start : start + 2]} -> {text[start + 1 : start + 3]}"
+        return "OK"
+
+    def complete(self, body: dict[str, Any]):
+        messages: list[dict[str, Any]] = body.get("messages", [])
+        system = next((m["content"] for m in messages if m["role"] == "system"), None)
+        prompt = "\n\n".join(m["content"] for m in messages if isinstance(m.get("content"), str))
+
+        answer = self.get_answer(prompt)
+        text = answer + ("\n\nExplanation: " + "理由" * self.config.chatty_tokens if self.config.chatty_tokens else "")
+        finish_reason = "stop"
+        max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+        if max_tokens is not None and len(text) > max_tokens:
+            text = text[:max_tokens]
+            finish_reason = "length"
+
+        effort = body.get("reasoning_effort")
+        reasoning = f"The task asks for a short answer; the answer is {answer}." if effort and effort != "none" else None
+
+        prompt_tokens = len(prompt)
+        reasoning_tokens = len(reasoning or "")
+        completion_tokens = len(text) + reasoning_tokens
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "cost": (prompt_tokens * self.config.prompt_price + completion_tokens * self.config.completion_price) / 1_000_000,
+            "prompt_tokens_details": {"cached_tokens": self.get_cached_tokens(system)},
+            "completion_tokens_details": {"reasoning_tokens": reasoning_tokens},
+        }
+        return text, reasoning, finish_reason, usage
+
+    def get_completion(self, body: dict[str, Any], completion_id: str, text: str, reasoning: str | None, finish_reason: str, usage: dict[str, Any]):
+        message = {"role": "assistant", "content": text, **({"reasoning": reasoning} if reasoning else {})}
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": message, "finish_reason": finish_reason}],
+            "usage": usage,
+        }
+
+    def add_file(self, filename: str, purpose: str, content: bytes):
+        with self._lock:
+            file_id = f"file-mock-{len(self.files)}"
+            self.files[file_id] = content
+        return {
+            "id": file_id,
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+        }
+
+    def create_batch(self, body: dict[str, Any]):
+        with self._lock:
+            batch_id = f"batch-mock-{len(self.batches)}"
+            batch = {
+                "id": batch_id,
+                "object": "batch",
+                "endpoint": body["endpoint"],
+                "input_file_id": body["input_file_id"],
+                "completion_window": body.get("completion_window", "24h"),
+                "status": "validating",
+                "created_at": int(time.time()),
+                "output_file_id": None,
+                "error_file_id": None,
+                "request_counts": {"total": 0, "completed": 0, "failed": 0},
+            }
+            self.batches[batch_id] = batch
+        threading.Thread(target=self.process_batch, args=(batch_id,), daemon=True).start()
+        return dict(batch)
+
+    def process_batch(self, batch_id: str):
+        batch = self.batches[batch_id]
+        lines = [json.loads(line) for line in self.files[batch["input_file_id"]].decode("utf-8").splitlines() if line.strip()]
+        with self._lock:
+            batch["status"] = "in_progress"
+            batch["request_counts"] = {"total": len(lines), "completed": 0, "failed": 0}
+        time.sleep(self.config.batch_seconds)
+
+        outputs: list[str] = []
+        for i, line in enumerate(lines):
+            text, reasoning, finish_reason, usage = self.complete(line["body"])
+            usage["cost"] *= self.config.batch_discount
+            completion = self.get_completion(line["body"], f"chatcmpl-mock-{batch_id}-{i}", text, reasoning, finish_reason, usage)
+            response = {"status_code": 200, "request_id": f"req-{i}", "body": completion}
+            outputs.append(
+                json.dumps({"id": f"batch_req_{i}", "custom_id": line["custom_id"], "response": response, "error": None}, ensure_ascii=False)
+            )
+
+        output = self.add_file(f"{batch_id}_output.jsonl", "batch_output", ("\n".join(outputs) + "\n").encode("utf-8"))
+        with self._lock:
+            batch["request_counts"]["completed"] = len(lines)
+            batch["output_file_id"] = output["id"]
+            batch["status"] = "completed"
+
+    def get_batch(self, batch_id: str):
+        with self._lock:
+            batch = self.batches.get(batch_id)
+            return dict(batch, request_counts=dict(batch["request_counts"])) if batch else None
+
+    def get_stats(self):
+        with self._lock:
+            elapsed = time.monotonic() - self.stats.started_at
+            latencies = list(self.stats.latencies)
+            percentiles = np.percentile(latencies, [50, 95, 99]).tolist() if latencies else [None, None, None]
+            return {
+                "requests": self.stats.requests,
+                "completed": self.stats.completed,
+                "cancelled": self.stats.cancelled,
+                "rate_limited": self.stats.rate_limited,
+                "max_in_flight": self.stats.max_in_flight,
+                "requests_per_second": self.stats.completed / elapsed if elapsed else 0.0,
+                "p50_latency_seconds": percentiles[0],
+                "p95_latency_seconds": percentiles[1],
+                "p99_latency_seconds": percentiles[2],
+            }
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    @property
+    def provider(self):
+        return cast("MockServer", self.server).provider
+
+    def log_message(self, format: str, *args: Any):
+        pass
+
+    def send_json(self, status: int, payload: Any, headers: dict[str, str] | None = None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def read_upload(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode("utf-8")
+        message = BytesParser(policy=HTTP).parsebytes(header + self.rfile.read(length))
+        fields: dict[str, Any] = {}
+        for part in message.iter_parts():
+            name = part.get_param("name", header="content-disposition") if isinstance(part, EmailMessage) else None
+            if isinstance(name, str):
+                fields[name] = (part.get_filename(), part.get_payload(decode=True))
+        return fields
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        provider = self.provider
+        if path == "/stats":
+            return self.send_json(200, provider.get_stats())
+        if match := BATCH_PATH_PATTERN.search(path):
+            batch = provider.get_batch(match[1])
+            return self.send_json(200, batch) if batch else self.send_json(404, {"error": {"message": f"No batch {match[1]}"}})
+        if (match := FILE_CONTENT_PATH_PATTERN.search(path)) and match[1] in provider.files:
+            content = provider.files[match[1]]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(content)))
+            self.end_headers()
+            return self.wfile.write(content)
+        self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def do_POST(self):
+        path = self.path.rstrip("/")
+        if path.endswith("/chat/completions"):
+            return self.chat_completions(self.read_json())
+        if path.endswith("/files"):
+            fields = self.read_upload()
+            filename, content = fields["file"]
+            purpose = fields["purpose"][1].decode("utf-8")
+            return self.send_json(200, self.provider.add_file(filename or "upload.jsonl", purpose, content))
+        if path.endswith("/batches"):
+            return self.send_json(200, self.provider.create_batch(self.read_json()))
+        self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def chat_completions(self, body: dict[str, Any]):
+        provider = self.provider
+        stats = provider.stats
+        with provider._lock:
+            stats.requests += 1
+        headers = provider.check_rate_limit(body.get("model", ""))
+        if headers is not None:
+            with provider._lock:
+                stats.rate_limited += 1
+            return self.send_json(429, {"error": {"message": "Rate limit exceeded", "code": 429}}, headers)
+
+        with provider._lock:
+            stats.in_flight += 1
+            stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+        start = time.monotonic()
+        try:
+            text, reasoning, finish_reason, usage = provider.complete(body)
+            latency = provider.get_latency()
+            if body.get("stream"):
+                self.stream_completion(body, text, reasoning, finish_reason, usage, latency)
+            else:
+                time.sleep(latency)
+                self.send_json(200, provider.get_completion(body, f"chatcmpl-mock-{stats.requests}", text, reasoning, finish_reason, usage))
+            with provider._lock:
+                stats.completed += 1
+                stats.latencies.append(time.monotonic() - start)
+        except (BrokenPipeError, ConnectionResetError):
+            with provider._lock:
+                stats.cancelled += 1
+            self.close_connection = True
+        finally:
+            with provider._lock:
+                stats.in_flight -= 1
+
+    def stream_completion(self, body: dict[str, Any], text: str, reasoning: str | None, finish_reason: str, usage: dict[str, Any], latency: float):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        base = {"id": f"chatcmpl-mock-{self.provider.stats.requests}", "object": "chat.completion.chunk", "created": int(time.time())}
+        base["model"] = body.get("model")
+
+        def send(choices: list[dict[str, Any]], **extra: Any):
+            self.wfile.write(f"data: {json.dumps({**base, 'choices': choices, **extra}, ensure_ascii=False)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        pieces = [text[i : i + 4] for i in range(0, len(text), 4)] or [""]
+        delay = latency / (len(pieces) + 1)
+        time.sleep(delay)
+        send([{"index": 0, "delta": {"role": "assistant", **({"reasoning": reasoning} if reasoning else {})}, "finish_reason": None}])
+        for piece in pieces:
+            time.sleep(delay)
+            send([{"index": 0, "delta": {"content": piece}, "finish_reason": None}])
+        send([{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send([], usage=usage)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 4096
+
+    def __init__(self, address: tuple[str, int], provider: MockProvider):
+        super().__init__(address, MockRequestHandler)
+        self.provider = provider
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+
+def start_mock_server(config: MockConfig, host: str = "127.0.0.1", port: int = 0):
+    server = MockServer((host, port), MockProvider(config))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local OpenAI-compatible stand-in for load and retry testing (set OPENAI_BASE_URL to its URL)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency-median", type=float, default=0.5, help="Median response latency in seconds (log-normal)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal sigma; larger values give a heavier tail")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute per model before answering 429 (0 disables)")
+    parser.add_argument("--rate-limit-probability", type=float, default=0.0, help="Probability of a spurious 429 without a reset header")
+    parser.add_argument(
+        "--accuracy", type=float, default=0.8, help="Probability that a character counting answer is exact; other task types are answered at random"
+    )
+    parser.add_argument("--chatty-tokens", type=int, default=0, help="Filler appended after the answer to exercise output caps")
+    parser.add_argument("--prompt-price", type=float, default=0.1, help="Dollars per million prompt tokens")
+    parser.add_argument("--completion-price", type=float, default=0.4, help="Dollars per million completion tokens")
+    parser.add_argument("--batch-seconds", type=float, default=1.0, help="Time a batch job stays in progress before completing")
+    parser.add_argument("--batch-discount", type=float, default=0.5, help="Cost multiplier applied to batch responses")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config = MockConfig(
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        rpm=args.rpm,
+        rate_limit_probability=args.rate_limit_probability,
+        accuracy=args.accuracy,
+        chatty_tokens=args.chatty_tokens,
+        prompt_price=args.prompt_price,
+        completion_price=args.completion_price,
+        batch_seconds=args.batch_seconds,
+        batch_discount=args.batch_discount,
+        seed=args.seed,
+    )
+    server = MockServer((args.host, args.port), MockProvider(config))
+    print(f"Mock provider listening on {server.base_url}; stats at http://{args.host}:{args.port}/stats")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(json.dumps(server.provider.get_stats(), indent=4))
+        server.server_close()
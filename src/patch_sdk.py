@@ -1,12 +1,104 @@
 import re
 import time
-from typing import Any
+from collections.abc import Callable
+from typing import Any, cast
 
+from ai_sdk import openai
 from ai_sdk.providers.openai import OpenAIModel
+from openai import APIConnectionError, APIStatusError, OpenAI
+from openai.types.chat import ChatCompletionMessageParam
+
+from src.rate_limiter import RATE_LIMIT_MAX_ATTEMPTS, RetryableError, RetryState, get_rate_limiter, get_retry_state
 
 _is_patched = False
 
 
+def get_rate_limit_headers(e: Exception) -> dict[str, str] | None:
+    if isinstance(e, APIStatusError):
+        if e.status_code != 429:
+            return None
+        return {k.lower(): v for k, v in e.response.headers.items() if k.lower().startswith("x-ratelimit-")}
+
+    error_str = str(e)
+    if "429" not in error_str:
+        return None
+    return {k.lower(): v for k, v in re.findall(r"'(X-RateLimit-[\w-]+)':\s*'([^']*)'", error_str, flags=re.IGNORECASE)}
+
+
+def is_transient_error(e: Exception):
+    if isinstance(e, APIStatusError):
+        return e.status_code in (408, 409) or e.status_code >= 500
+    return isinstance(e, APIConnectionError)
+
+
+def create_model(model: str):
+    instance = openai(model)
+    # Retries go through the rate-limit aware loop in patched_generate_text, so the SDK must not retry on its own.
+    instance._client = instance._client.with_options(max_retries=0)
+    return instance
+
+
+def get_reasoning_options(model: str, reasoning: str | None) -> dict[str, Any]:
+    if not reasoning:
+        return {}
+    if "/" in model:
+        return {"reasoning_effort": reasoning, "include_reasoning": reasoning != "none"}
+    return {"reasoning_effort": reasoning}
+
+
+def build_messages(prompt: str | None, system: str | None, messages: list[dict[str, Any]] | None):
+    chat_messages: list[ChatCompletionMessageParam] = []
+    if system:
+        chat_messages.append({"role": "system", "content": system})
+    chat_messages.extend(cast(list[ChatCompletionMessageParam], messages or []))
+    if prompt is not None:
+        chat_messages.append({"role": "user", "content": prompt})
+    return chat_messages
+
+
+def get_stop_prefix(text: str, start: int, stop_when: Callable[[str], bool]):
+    # A chunk may complete the answer and carry more text, e.g. "2\n\nE", so check every prefix ending inside it and keep the shortest match.
+    for end in range(start + 1, len(text) + 1):
+        if stop_when(text[:end]):
+            return text[:end]
+    return None
+
+
+def stream_until(client: OpenAI, model: str, stop_when: Callable[[str], bool], messages: list[ChatCompletionMessageParam], **kwargs: Any):
+    stream = client.chat.completions.create(model=model, messages=messages, stream=True, stream_options={"include_usage": True}, **kwargs)
+
+    text = ""
+    reasoning = ""
+    finish_reason = "unknown"
+    last_chunk = None
+    with stream:
+        for chunk in stream:
+            last_chunk = chunk
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            reasoning += getattr(choice.delta, "reasoning_content", None) or getattr(choice.delta, "reasoning", None) or ""
+            if choice.delta.content:
+                start = len(text)
+                text += choice.delta.content
+                if (prefix := get_stop_prefix(text, start, stop_when)) is not None:
+                    # Leaving the block closes the connection, which is what cancels generation; the usage chunk never arrives, so cost is unknown.
+                    text = prefix
+                    finish_reason = "stop_when"
+                    break
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+
+    usage = getattr(last_chunk, "usage", None) if finish_reason != "stop_when" else None
+    return {
+        "text": text,
+        "finish_reason": finish_reason,
+        "usage": usage.model_dump() if usage else None,
+        "raw_response": last_chunk,
+        "reasoning": reasoning or None,
+    }
+
+
 def patch_openai_provider():
     global _is_patched
     if _is_patched:
@@ -18,41 +110,71 @@ def patch_openai_provider():
         self: OpenAIModel, *, prompt: str | None = None, system: str | None = None, messages: list[dict[str, Any]] | None = None, **kwargs: Any
     ):
         reasoning = kwargs.pop("reasoning", None)
+        stop_when = kwargs.pop("stop_when", None)
         if reasoning:
             if "/" in self._model:
-                extra_body = kwargs.setdefault("extra_body", {})
-                extra_body["reasoning_effort"] = reasoning
-                extra_body["include_reasoning"] = reasoning != "none"
+                kwargs.setdefault("extra_body", {}).update(get_reasoning_options(self._model, reasoning))
             else:
-                kwargs["reasoning_effort"] = reasoning
+                kwargs.update(get_reasoning_options(self._model, reasoning))
 
+        rate_limiter = get_rate_limiter(self._model)
+        # Under ConcurrencyLimiter.run the limiter already waited for rate_limiter and does the backoff itself, outside its slots.
+        retry_state = get_retry_state()
+        state = retry_state or RetryState()
         while True:
+            if retry_state is None:
+                state.rate_limited_seconds += rate_limiter.acquire()
+            start = time.perf_counter()
             try:
-                result = original_generate_text(self, prompt=prompt, system=system, messages=messages, **kwargs)
+                if stop_when is None:
+                    result = original_generate_text(self, prompt=prompt, system=system, messages=messages, **kwargs)
+                else:
+                    chat_messages = build_messages(prompt=prompt, system=system, messages=messages)
+                    result = stream_until(self._client, self._model, stop_when, chat_messages, **{**self._default_kwargs, **kwargs})
+                rate_limiter.on_success()
+                request_seconds = time.perf_counter() - start
                 break
             except Exception as e:
-                error_str = str(e)
-                if "429" in error_str:
-                    match = re.search(r"'X-RateLimit-Reset':\s*'(\d+)'", error_str)
-                    if match:
-                        reset_timestamp_ms = int(match.group(1))
-                        wait_time = (reset_timestamp_ms / 1000.0) - time.time() + 1.0
-                        if wait_time > 0:
-                            print(f"Rate limit exceeded. Waiting {wait_time:.2f} seconds until reset...")
-                            time.sleep(wait_time)
-                            continue
-                    print("Rate limit exceeded. Waiting 10 seconds (fallback)...")
-                    time.sleep(10)
-                    continue
-                raise e
+                # Failed attempts and the backoff after transient errors are retry time; the backoff after a 429 is rate-limit time.
+                state.retry_seconds += time.perf_counter() - start
+                headers = get_rate_limit_headers(e)
+                if headers is not None:
+                    rate_limiter.on_rate_limited(headers)
+                    error = "Rate limit exceeded"
+                elif is_transient_error(e):
+                    error = f"Transient error ({type(e).__name__})"
+                else:
+                    raise e
+
+                state.attempt += 1
+                if state.attempt >= RATE_LIMIT_MAX_ATTEMPTS:
+                    print(f"{error} for {self._model}. Giving up after {state.attempt} attempts.")
+                    raise e
+
+                wait_time = rate_limiter.get_backoff(state.attempt)
+                print(f"{error} for {self._model}. Retrying in {wait_time:.2f} seconds (attempt {state.attempt})...")
+                if headers is not None:
+                    state.rate_limited_seconds += wait_time
+                else:
+                    state.retry_seconds += wait_time
+                if retry_state is not None:
+                    raise RetryableError(wait_time) from e
+                time.sleep(wait_time)
 
         raw_response = result.get("raw_response")
-        if raw_response and hasattr(raw_response, "choices") and raw_response.choices:
+        if raw_response and getattr(raw_response, "choices", None) and hasattr(raw_response.choices[0], "message"):
             message = raw_response.choices[0].message
             reasoning_val = getattr(message, "reasoning_content", None) or getattr(message, "reasoning", None) or getattr(message, "thought", None)
             if reasoning_val:
                 result["reasoning"] = reasoning_val
 
+        result["provider_metadata"] = {
+            **(result.get("provider_metadata") or {}),
+            "retries": state.attempt,
+            "request_seconds": request_seconds,
+            "rate_limited_seconds": state.rate_limited_seconds,
+            "retry_seconds": state.retry_seconds,
+        }
         return result
 
     OpenAIModel.generate_text = patched_generate_text
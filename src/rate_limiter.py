@@ -0,0 +1,126 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections.abc import Callable, Mapping
+from dataclasses import dataclass
+from typing import TypeVar
+
+T = TypeVar("T")
+
+RATE_LIMIT_RPS = float(os.getenv("RATE_LIMIT_RPS", "10"))
+RATE_LIMIT_MIN_RPS = float(os.getenv("RATE_LIMIT_MIN_RPS", "0.1"))
+RATE_LIMIT_MAX_RPS = float(os.getenv("RATE_LIMIT_MAX_RPS", "100"))
+RATE_LIMIT_INCREASE = float(os.getenv("RATE_LIMIT_INCREASE", "0.5"))
+RATE_LIMIT_BASE_BACKOFF = float(os.getenv("RATE_LIMIT_BASE_BACKOFF", "1"))
+RATE_LIMIT_MAX_BACKOFF = float(os.getenv("RATE_LIMIT_MAX_BACKOFF", "60"))
+RATE_LIMIT_MAX_ATTEMPTS = int(os.getenv("RATE_LIMIT_MAX_ATTEMPTS", "8"))
+RATE_LIMIT_WINDOW_SECONDS = 60.0
+
+
+class RateLimiter:
+    def __init__(self, rate: float, min_rate: float, max_rate: float, increase: float):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.tokens = 1.0
+        self.blocked_until = 0.0
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self.blocked_until:
+                return self.blocked_until - now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return 0.0
+            return (1.0 - self.tokens) / self.rate
+
+    def acquire(self):
+        waited = 0.0
+        while wait_time := self.try_acquire():
+            time.sleep(wait_time)
+            waited += wait_time
+        return waited
+
+    async def aacquire(self):
+        waited = 0.0
+        while wait_time := self.try_acquire():
+            await asyncio.sleep(wait_time)
+            waited += wait_time
+        return waited
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_rate_limited(self, headers: Mapping[str, str]):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = 0.0
+
+            limit = headers.get("x-ratelimit-limit")
+            if limit and limit.isdigit():
+                self.max_rate = max(self.min_rate, int(limit) / RATE_LIMIT_WINDOW_SECONDS)
+                self.rate = min(self.rate, self.max_rate)
+
+            reset = headers.get("x-ratelimit-reset")
+            remaining = headers.get("x-ratelimit-remaining")
+            if reset and reset.isdigit() and remaining in (None, "0"):
+                wait_time = int(reset) / 1000.0 - time.time()
+                if wait_time > 0:
+                    self.blocked_until = max(self.blocked_until, time.monotonic() + wait_time)
+
+    def get_backoff(self, attempt: int):
+        return random.uniform(0, min(RATE_LIMIT_MAX_BACKOFF, RATE_LIMIT_BASE_BACKOFF * 2**attempt))
+
+
+_rate_limiters: dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(key: str):
+    with _rate_limiters_lock:
+        if key not in _rate_limiters:
+            _rate_limiters[key] = RateLimiter(
+                rate=RATE_LIMIT_RPS, min_rate=RATE_LIMIT_MIN_RPS, max_rate=RATE_LIMIT_MAX_RPS, increase=RATE_LIMIT_INCREASE
+            )
+        return _rate_limiters[key]
+
+
+@dataclass
+class RetryState:
+    attempt: int = 0
+    rate_limited_seconds: float = 0.0
+    retry_seconds: float = 0.0
+
+
+class RetryableError(Exception):
+    def __init__(self, wait_time: float):
+        super().__init__(f"Retry in {wait_time:.2f} seconds")
+        self.wait_time = wait_time
+
+
+_retry_state = threading.local()
+
+
+def get_retry_state() -> RetryState | None:
+    return getattr(_retry_state, "current", None)
+
+
+def run_with_retry_state(state: RetryState, fn: Callable[[], T]) -> T:
+    # With a state set, the request is retried by the caller (ConcurrencyLimiter.run), which waits without holding any slot.
+    _retry_state.current = state
+    try:
+        return fn()
+    finally:
+        _retry_state.current = None
@@ -0,0 +1,120 @@
+import json
+import os
+import re
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from src.run.model import ModelConfig
+
+if TYPE_CHECKING:
+    import openai
+
+BATCH_DIR = Path("data/batches")
+BATCH_POLL_SECONDS = float(os.getenv("BATCH_POLL_SECONDS", "30"))
+BATCH_COMPLETION_WINDOW = os.getenv("BATCH_COMPLETION_WINDOW", "24h")
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+@dataclass
+class BatchJob:
+    run_id: str
+    model: str
+    input_file_id: str
+    batch_id: str
+    status: str
+    requests: dict[str, list[str]]
+    output_file_id: str | None = None
+    error_file_id: str | None = None
+
+
+class BatchClient:
+    def __init__(self, directory: Path = BATCH_DIR):
+        self.directory = directory
+        self._client: "openai.OpenAI | None" = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import openai
+
+            self._client = openai.OpenAI()
+        return self._client
+
+    def get_path(self, run_id: str, model_config: ModelConfig):
+        return self.directory / f"{run_id}_{re.sub(r'[^\w.-]+', '_', str(model_config))}.json"
+
+    def load(self, run_id: str, model_config: ModelConfig):
+        path = self.get_path(run_id, model_config)
+        if not path.exists():
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return BatchJob(**json.load(f))
+
+    def save(self, job: BatchJob, model_config: ModelConfig):
+        path = self.get_path(job.run_id, model_config)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(job), f, ensure_ascii=False, indent=4)
+        tmp_path.replace(path)
+
+    def submit(self, run_id: str, model_config: ModelConfig, requests: list[tuple[list[str], dict[str, Any]]]):
+        input_path = self.get_path(run_id, model_config).with_suffix(".jsonl")
+        input_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(input_path, "w", encoding="utf-8") as f:
+            for _, request in requests:
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+        with open(input_path, "rb") as f:
+            input_file = self.client.files.create(file=f, purpose="batch")
+        batch = self.client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/v1/chat/completions",
+            completion_window=BATCH_COMPLETION_WINDOW,  # type: ignore[arg-type]
+        )
+
+        job = BatchJob(
+            run_id=run_id,
+            model=str(model_config),
+            input_file_id=input_file.id,
+            batch_id=batch.id,
+            status=batch.status,
+            requests={request["custom_id"]: key for key, request in requests},
+        )
+        self.save(job, model_config)
+        print(f"Submitted batch {batch.id} with {len(requests)} requests for {model_config}")
+        return job
+
+    def poll(self, job: BatchJob, model_config: ModelConfig, poll_seconds: float = BATCH_POLL_SECONDS):
+        while job.status not in BATCH_TERMINAL_STATUSES:
+            batch = self.client.batches.retrieve(job.batch_id)
+            if batch.status != job.status:
+                counts = batch.request_counts
+                progress = f" ({counts.completed}/{counts.total} done, {counts.failed} failed)" if counts else ""
+                print(f"Batch {job.batch_id} for {model_config}: {job.status} -> {batch.status}{progress}")
+            job.status = batch.status
+            job.output_file_id = batch.output_file_id
+            job.error_file_id = batch.error_file_id
+            self.save(job, model_config)
+            if job.status not in BATCH_TERMINAL_STATUSES:
+                time.sleep(poll_seconds)
+        return job
+
+    def download(self, job: BatchJob):
+        bodies: dict[str, dict[str, Any]] = {}
+        errors: dict[str, str] = {}
+        for file_id in (job.output_file_id, job.error_file_id):
+            if file_id is None:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                if record.get("error") is None and response.get("status_code") == 200:
+                    bodies[record["custom_id"]] = response["body"]
+                else:
+                    errors[record["custom_id"]] = json.dumps(record.get("error") or response.get("body"), ensure_ascii=False)
+        return bodies, errors
@@ -0,0 +1,31 @@
+import threading
+
+
+class BudgetExceededError(Exception):
+    pass
+
+
+class Budget:
+    def __init__(self, limit: float | None):
+        self.limit = limit
+        self.spent = 0.0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    @property
+    def exhausted(self):
+        return self.limit is not None and self.spent >= self.limit
+
+    def check(self):
+        with self._lock:
+            if self.exhausted:
+                self.skipped += 1
+                raise BudgetExceededError(f"Budget of ${self.limit:.4f} exhausted (spent ${self.spent:.4f})")
+
+    def charge(self, dollars: float):
+        with self._lock:
+            self.spent += dollars
+
+    def __str__(self):
+        limit = f"${self.limit:.4f}" if self.limit is not None else "unlimited"
+        return f"Budget: spent ${self.spent:.4f} of {limit}, skipped {self.skipped} requests"
@@ -1,16 +1,36 @@
+import argparse
+import asyncio
 import datetime
 import json
 import os
-import random
-from concurrent.futures import ThreadPoolExecutor
 from dataclasses import asdict
+from functools import cached_property
 from pathlib import Path
-from typing import cast
+from typing import Any, cast
+
+import numpy as np
 
-import src.patch_sdk as _
 from src.dataset.index import DatasetLoader
 from src.dataset.model import DatasetName
-from src.run.model import BatchResult, DatasetResult, ModelConfig, ModelResult, Reasoning, ResultSummary, StrategySummary
+from src.run.batch import BATCH_POLL_SECONDS, BATCH_TERMINAL_STATUSES, BatchClient
+from src.run.budget import Budget, BudgetExceededError
+from src.run.journal import RunJournal
+from src.run.limiter import ConcurrencyLimiter
+from src.run.model import (
+    BatchResult,
+    CostEstimate,
+    DatasetResult,
+    ModelConfig,
+    ModelResult,
+    Reasoning,
+    ResultSummary,
+    StopReason,
+    StrategySummary,
+    batch_result_from_dict,
+    parse_shard,
+)
+from src.run.stats import paired_statistics, sequential_decisions
+from src.run.store import result_store
 from src.task.index import TaskRunner
 from src.task.model import Task, TaskResult
 from src.tokenizer import TOKENIZATION_STRATEGIES, TokenizationStrategy
@@ -19,72 +39,435 @@ RESULT_DIR = Path("data/results")
 
 
 class Runner:
-    dataset_loader = DatasetLoader()
     task_runner = TaskRunner()
+    batch_client = BatchClient()
+    limiter = ConcurrencyLimiter(
+        global_limit=int(os.getenv("RUN_CONCURRENCY", "64")),
+        provider_limit=int(os.getenv("RUN_PROVIDER_CONCURRENCY", "32")),
+        model_limit=int(os.getenv("RUN_MODEL_CONCURRENCY", "16")),
+    )
+
+    @cached_property
+    def dataset_loader(self):
+        return DatasetLoader()
+
+    def run(
+        self,
+        model_config: ModelConfig,
+        dataset_name: DatasetName,
+        strategies: list[TokenizationStrategy],
+        n: int,
+        seed: int = 0,
+        journal: RunJournal | None = None,
+        budget: Budget | None = None,
+        wave_size: int | None = None,
+    ):
+        return asyncio.run(
+            self.arun(
+                model_config=model_config,
+                dataset_name=dataset_name,
+                strategies=strategies,
+                n=n,
+                seed=seed,
+                journal=journal,
+                budget=budget,
+                wave_size=wave_size,
+            )
+        )
+
+    async def arun(
+        self,
+        model_config: ModelConfig,
+        dataset_name: DatasetName,
+        strategies: list[TokenizationStrategy],
+        n: int,
+        seed: int = 0,
+        journal: RunJournal | None = None,
+        budget: Budget | None = None,
+        wave_size: int | None = None,
+    ):
+        tasks = await self.aload_tasks(dataset_name=dataset_name, strategies=strategies, n=n, seed=seed)
+        return await self.arun_tasks(
+            model_config=model_config,
+            dataset_name=dataset_name,
+            strategies=strategies,
+            tasks=tasks,
+            journal=journal,
+            budget=budget,
+            wave_size=wave_size,
+        )
+
+    async def aload_tasks(
+        self, dataset_name: DatasetName, strategies: list[TokenizationStrategy], n: int, seed: int = 0, shard: tuple[int, int] | None = None
+    ):
+        tasks = await asyncio.to_thread(self.dataset_loader.sample_tasks, dataset_name, n=n, seed=seed)
+        if shard is not None:
+            # Strided so every shard draws from the same seeded sample and merge_shards can restore its order.
+            tasks = tasks[shard[0] :: shard[1]]
+        await asyncio.to_thread(self.task_runner.pre_tokenize, tasks, strategies)
+        return tasks
 
-    def run(self, model_config: ModelConfig, dataset_name: DatasetName, strategies: list[TokenizationStrategy], n: int, seed: int = 0):
-        print(f"Running {dataset_name} with {model_config} for n={n}, seed={seed}...")
-        all_tasks = list(self.dataset_loader.load_tasks(dataset_name))
-        random.Random(seed).shuffle(all_tasks)
-        tasks = all_tasks[:n]
-
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            strategy_to_result_list: list[dict[TokenizationStrategy, TaskResult]] = list(
-                executor.map(
-                    lambda t: self.task_runner.run(model_config=model_config, strategies=strategies, task=t),
-                    tasks,
+    async def arun_tasks(
+        self,
+        model_config: ModelConfig,
+        dataset_name: DatasetName,
+        strategies: list[TokenizationStrategy],
+        tasks: list[Task],
+        journal: RunJournal | None = None,
+        budget: Budget | None = None,
+        wave_size: int | None = None,
+    ):
+        if wave_size is not None and wave_size <= 0:
+            raise ValueError(f"wave_size must be positive, got {wave_size}")
+        waves = f" in waves of {wave_size}" if wave_size else ""
+        print(f"Running {dataset_name} with {model_config} for n={len(tasks)}{waves}...")
+        strategy_to_result_list: list[dict[TokenizationStrategy, TaskResult]] = []
+        stop_reason: StopReason | None = None
+        size = wave_size or max(1, len(tasks))
+        n_looks = -(-len(tasks) // size)
+        for start in range(0, len(tasks), size):
+            strategy_to_result_list.extend(
+                await asyncio.gather(
+                    *(
+                        self.arun_task(
+                            model_config=model_config, dataset_name=dataset_name, strategies=strategies, task=t, journal=journal, budget=budget
+                        )
+                        for t in tasks[start : start + size]
+                    )
                 )
             )
+            if wave_size is None:
+                break
+            if budget is not None and budget.exhausted:
+                stop_reason = "budget"
+                break
+            if self.is_decided(model_config, dataset_name, strategies, strategy_to_result_list, n_looks):
+                stop_reason = "decided"
+                break
+        else:
+            if wave_size is not None:
+                stop_reason = "n_max"
+
+        n_complete = sum(len(s_to_r) == len(strategies) for s_to_r in strategy_to_result_list)
+        if n_complete < len(strategy_to_result_list):
+            print(f"Budget exhausted: {n_complete}/{len(strategy_to_result_list)} tasks of {dataset_name} completed with every strategy")
+        if n_complete == 0:
+            raise BudgetExceededError(f"No task of {dataset_name} completed with every strategy before the budget ran out")
 
         return DatasetResult(
             dollars=sum(r.dollars for s_to_r in strategy_to_result_list for r in s_to_r.values()),
             summary=self.calculate_summary(strategies, strategy_to_result_list),
             strategy_results=strategy_to_result_list,
+            stop_reason=stop_reason,
+        )
+
+    def is_decided(
+        self,
+        model_config: ModelConfig,
+        dataset_name: DatasetName,
+        strategies: list[TokenizationStrategy],
+        strategy_to_result_list: list[dict[TokenizationStrategy, TaskResult]],
+        n_looks: int,
+    ):
+        complete = [s_to_r for s_to_r in strategy_to_result_list if all(strategy in s_to_r for strategy in strategies)]
+        if len(complete) < 2 or len(strategies) < 2:
+            return False
+        score_matrix = np.array([[s_to_r[strategy].evaluation for s_to_r in complete] for strategy in strategies], dtype=np.float64)
+        decisions = sequential_decisions(score_matrix, baseline_index=strategies.index("baseline"), n_looks=n_looks)
+        status = ", ".join(
+            f"{strategy} {d.decision or 'undecided'} (delta {d.delta:+.3f} [{d.delta_low:+.3f}, {d.delta_high:+.3f}])"
+            for strategy, d in zip(strategies, decisions)
+            if d is not None
         )
+        print(f"{dataset_name} with {model_config} at n={len(complete)}: {status}")
+        return all(d.decision is not None for d in decisions if d is not None)
+
+    async def arun_batch(
+        self,
+        model_configs: list[ModelConfig],
+        dataset_names: list[DatasetName],
+        strategies: list[TokenizationStrategy],
+        n: int,
+        seed: int = 0,
+        journal: RunJournal | None = None,
+        budget: Budget | None = None,
+        shard: tuple[int, int] | None = None,
+        wave_size: int | None = None,
+    ):
+        # Every (model, dataset) cell shares one gather, so only the per-model and per-provider limits pace each model.
+        loads: dict[DatasetName, asyncio.Future[list[Task]]] = {
+            dataset_name: asyncio.ensure_future(self.aload_tasks(dataset_name=dataset_name, strategies=strategies, n=n, seed=seed, shard=shard))
+            for dataset_name in dataset_names
+        }
+
+        async def arun_cell(model_config: ModelConfig, dataset_name: DatasetName):
+            tasks = await loads[dataset_name]
+            return await self.arun_tasks(
+                model_config=model_config,
+                dataset_name=dataset_name,
+                strategies=strategies,
+                tasks=tasks,
+                journal=journal,
+                budget=budget,
+                wave_size=wave_size,
+            )
+
+        cells: list[tuple[ModelConfig, DatasetName]] = [
+            (model_config, dataset_name) for model_config in model_configs for dataset_name in dataset_names
+        ]
+        outcomes = await asyncio.gather(*(arun_cell(model_config, dataset_name) for model_config, dataset_name in cells), return_exceptions=True)
+        return list(zip(cells, outcomes))
+
+    async def arun_task(
+        self,
+        model_config: ModelConfig,
+        dataset_name: DatasetName,
+        strategies: list[TokenizationStrategy],
+        task: Task,
+        journal: RunJournal | None,
+        budget: Budget | None = None,
+    ):
+        async def arun_strategy(strategy: TokenizationStrategy):
+            result = journal.get(model_config, dataset_name, task.id, strategy) if journal is not None else None
+            if result is None:
+                try:
+                    result = await self.task_runner.arun_strategy(
+                        model_config=model_config, strategy=strategy, task=task, limiter=self.limiter, budget=budget
+                    )
+                except BudgetExceededError:
+                    return None
+                if journal is not None:
+                    journal.append(model_config, dataset_name, result)
+                    # Rows land as they complete, so a crashed run is still queryable before it is resumed.
+                    result_store.add_result(journal.run_id, str(model_config), dataset_name, result)
+            return result
+
+        task_results = await asyncio.gather(*(arun_strategy(strategy) for strategy in strategies))
+        strategy_to_result: dict[TokenizationStrategy, TaskResult] = {r.tokenization_strategy: r for r in task_results if r is not None}
+        return strategy_to_result
 
     def calculate_summary(self, strategies: list[TokenizationStrategy], strategy_to_result_list: list[dict[TokenizationStrategy, TaskResult]]):
+        strategy_to_result_list = [s_to_r for s_to_r in strategy_to_result_list if all(strategy in s_to_r for strategy in strategies)]
         baseline_scores = [s_to_r["baseline"].evaluation for s_to_r in strategy_to_result_list]
         baseline_avg = sum(baseline_scores) / len(baseline_scores)
 
+        score_matrix = np.array([[s_to_r[strategy].evaluation for s_to_r in strategy_to_result_list] for strategy in strategies], dtype=np.float64)
+        statistics = paired_statistics(score_matrix, baseline_index=strategies.index("baseline"))
+
         summary: ResultSummary = {}
 
-        for strategy in strategies:
+        for strategy, stats in zip(strategies, statistics):
             strategy_results = [r[strategy] for r in strategy_to_result_list]
             scores = [r.evaluation for r in strategy_results]
             dollars_list = [r.dollars for r in strategy_results]
             avg = sum(scores) / len(scores)
 
             summary[strategy] = StrategySummary(
-                avg_score=avg, total_dollars=sum(dollars_list), delta=avg - baseline_avg if strategy != "baseline" else None
+                avg_score=avg,
+                total_dollars=sum(dollars_list),
+                delta=avg - baseline_avg if strategy != "baseline" else None,
+                ci_low=stats.ci_low,
+                ci_high=stats.ci_high,
+                delta_ci_low=stats.delta_ci_low,
+                delta_ci_high=stats.delta_ci_high,
+                p_value=stats.p_value,
+                p50_latency_seconds=self.get_percentile([r.latency_seconds for r in strategy_results], 50),
+                p95_latency_seconds=self.get_percentile([r.latency_seconds for r in strategy_results], 95),
+                mean_prompt_chars=self.get_mean([r.prompt_chars for r in strategy_results]),
+                mean_prompt_tokens=self.get_mean([r.prompt_tokens for r in strategy_results]),
+                mean_completion_tokens=self.get_mean([r.completion_tokens for r in strategy_results]),
+                mean_reasoning_tokens=self.get_mean([r.reasoning_tokens for r in strategy_results]),
+                mean_cached_prompt_tokens=self.get_mean([r.cached_prompt_tokens for r in strategy_results]),
             )
 
         return summary
 
+    @staticmethod
+    def get_percentile(values: list[float | None], q: float):
+        present = [v for v in values if v is not None]
+        return float(np.percentile(present, q)) if present else None
+
+    @staticmethod
+    def get_mean(values: list[float | None]):
+        present = [v for v in values if v is not None]
+        return sum(present) / len(present) if present else None
+
     def run_batch(
-        self, model_configs: list[ModelConfig], dataset_names: list[DatasetName], strategies: list[TokenizationStrategy], n: int, seed: int
+        self,
+        model_configs: list[ModelConfig],
+        dataset_names: list[DatasetName],
+        strategies: list[TokenizationStrategy],
+        n: int,
+        seed: int,
+        run_id: str | None = None,
+        budget: Budget | None = None,
+        shard: tuple[int, int] | None = None,
+        wave_size: int | None = None,
     ):
+        if shard is not None and wave_size is not None:
+            # Adaptive shards stop at different waves, so they could no longer be interleaved back into one sample.
+            raise ValueError("Sharded runs cannot use wave_size")
+        run_id = run_id or datetime.datetime.now().strftime("%Y%m%d_%H%M%S") + (f"_shard{shard[0]}of{shard[1]}" if shard else "")
+        journal = RunJournal(RESULT_DIR / f"{run_id}.jsonl")
+        journal.start(
+            model_configs=model_configs, dataset_names=dataset_names, strategies=strategies, n=n, seed=seed, shard=shard, wave_size=wave_size
+        )
+        if journal.results:
+            print(f"Resuming run {run_id} with {len(journal.results)} completed results...")
+        result_store.add_run(run_id, model_configs=model_configs, datasets=dataset_names, strategies=strategies, n=n, seed=seed)
+
+        cell_results = asyncio.run(
+            self.arun_batch(
+                model_configs=model_configs,
+                dataset_names=dataset_names,
+                strategies=strategies,
+                n=n,
+                seed=seed,
+                journal=journal,
+                budget=budget,
+                shard=shard,
+                wave_size=wave_size,
+            )
+        )
+
         model_results: dict[str, ModelResult] = {}
 
         for model_config in model_configs:
             dataset_results: dict[DatasetName, DatasetResult] = {}
-            for dataset_name in dataset_names:
-                try:
-                    dataset_results[dataset_name] = self.run(
-                        model_config=model_config, dataset_name=dataset_name, strategies=strategies, n=n, seed=seed
-                    )
-                except Exception as e:
-                    print(f"Error running {dataset_name} with {model_config}: {e}")
+            for (cell_model_config, dataset_name), outcome in cell_results:
+                if cell_model_config is not model_config:
+                    continue
+                if isinstance(outcome, Exception):
+                    ran = any(key[:2] == (str(model_config), dataset_name) for key in journal.results)
+                    resume = f" Completed results are kept, resume with --resume {run_id}" if ran else ""
+                    print(f"Error running {dataset_name} with {model_config}: {outcome}.{resume}")
+                elif isinstance(outcome, BaseException):
+                    raise outcome
+                else:
+                    dataset_results[dataset_name] = outcome
 
             if dataset_results:
-                model_results[str(model_config)] = ModelResult(
-                    dollars=sum(r.dollars for r in dataset_results.values()),
-                    summary=self.aggregate_summaries(strategies=strategies, summaries=[r.summary for r in dataset_results.values()]),
-                    dataset_results=dataset_results,
+                model_results[str(model_config)] = self.get_model_result(strategies, dataset_results)
+
+        journal.close()
+        if budget is not None:
+            print(budget)
+        if not model_results:
+            return
+        return self.save_batch(
+            run_id=run_id,
+            model_configs=model_configs,
+            dataset_names=dataset_names,
+            strategies=strategies,
+            n=n,
+            seed=seed,
+            model_results=model_results,
+            shard=shard,
+        )
+
+    def run_batch_api(
+        self,
+        model_configs: list[ModelConfig],
+        dataset_names: list[DatasetName],
+        strategies: list[TokenizationStrategy],
+        n: int,
+        seed: int,
+        run_id: str | None = None,
+        poll_seconds: float = BATCH_POLL_SECONDS,
+    ):
+        run_id = run_id or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        dataset_tasks: dict[DatasetName, list[Task]] = {}
+        for dataset_name in dataset_names:
+            dataset_tasks[dataset_name] = self.dataset_loader.sample_tasks(dataset_name, n=n, seed=seed)
+            self.task_runner.pre_tokenize(dataset_tasks[dataset_name], strategies)
+        tasks_by_id = {(dataset_name, task.id): task for dataset_name, tasks in dataset_tasks.items() for task in tasks}
+
+        model_results: dict[str, ModelResult] = {}
+        for model_config in model_configs:
+            results: dict[tuple[DatasetName, str, TokenizationStrategy], TaskResult] = {}
+            requests: list[tuple[list[str], dict[str, Any]]] = []
+            for dataset_name, tasks in dataset_tasks.items():
+                for task in tasks:
+                    for strategy in strategies:
+                        cached = self.task_runner.get_cached_result(model_config, strategy, task)
+                        if cached is not None:
+                            results[(dataset_name, task.id, strategy)] = cached
+                        else:
+                            custom_id = f"request-{len(requests)}"
+                            requests.append(
+                                ([dataset_name, task.id, strategy], self.task_runner.get_batch_request(model_config, strategy, task, custom_id))
+                            )
+
+            if requests:
+                # A job persisted by an earlier invocation of the same run is resumed instead of resubmitted,
+                # unless it failed, expired or was cancelled, in which case the still-uncached requests are submitted again.
+                job = self.batch_client.load(run_id, model_config)
+                if job is not None and job.status in BATCH_TERMINAL_STATUSES and job.status != "completed":
+                    print(f"Batch {job.batch_id} for {model_config} ended as {job.status}, resubmitting {len(requests)} requests")
+                    job = None
+                if job is None:
+                    job = self.batch_client.submit(run_id, model_config, requests)
+                job = self.batch_client.poll(job, model_config, poll_seconds)
+                bodies, errors = self.batch_client.download(job)
+                for custom_id, (job_dataset_name, task_id, job_strategy) in job.requests.items():
+                    if custom_id in bodies:
+                        dataset_name, strategy = cast(DatasetName, job_dataset_name), cast(TokenizationStrategy, job_strategy)
+                        task = tasks_by_id[(dataset_name, task_id)]
+                        results[(dataset_name, task_id, strategy)] = self.task_runner.get_batch_result(
+                            model_config, strategy, task, bodies[custom_id]
+                        )
+                if errors:
+                    print(f"{len(errors)} batch requests for {model_config} failed, e.g. {next(iter(errors.values()))}")
+                if job.status != "completed":
+                    print(f"Batch {job.batch_id} for {model_config} ended as {job.status}")
+
+            dataset_results: dict[DatasetName, DatasetResult] = {}
+            for dataset_name, tasks in dataset_tasks.items():
+                strategy_to_result_list: list[dict[TokenizationStrategy, TaskResult]] = [
+                    {strategy: results[(dataset_name, task.id, strategy)] for strategy in strategies if (dataset_name, task.id, strategy) in results}
+                    for task in tasks
+                ]
+                if not any(len(s_to_r) == len(strategies) for s_to_r in strategy_to_result_list):
+                    print(f"No complete batch results for {dataset_name} with {model_config}")
+                    continue
+                dataset_results[dataset_name] = DatasetResult(
+                    dollars=sum(r.dollars for s_to_r in strategy_to_result_list for r in s_to_r.values()),
+                    summary=self.calculate_summary(strategies, strategy_to_result_list),
+                    strategy_results=strategy_to_result_list,
                 )
+            if dataset_results:
+                model_results[str(model_config)] = self.get_model_result(strategies, dataset_results)
 
         if not model_results:
             return
+        return self.save_batch(
+            run_id=run_id,
+            model_configs=model_configs,
+            dataset_names=dataset_names,
+            strategies=strategies,
+            n=n,
+            seed=seed,
+            model_results=model_results,
+        )
+
+    def get_model_result(self, strategies: list[TokenizationStrategy], dataset_results: dict[DatasetName, DatasetResult]):
+        return ModelResult(
+            dollars=sum(r.dollars for r in dataset_results.values()),
+            summary=self.aggregate_summaries(strategies=strategies, summaries=[r.summary for r in dataset_results.values()]),
+            dataset_results=dataset_results,
+        )
 
+    def save_batch(
+        self,
+        run_id: str,
+        model_configs: list[ModelConfig],
+        dataset_names: list[DatasetName],
+        strategies: list[TokenizationStrategy],
+        n: int,
+        seed: int,
+        model_results: dict[str, ModelResult],
+        shard: tuple[int, int] | None = None,
+    ):
         batch_result = BatchResult(
             model_config=model_configs,
             datasets=dataset_names,
@@ -94,13 +477,128 @@ class Runner:
             model_results=model_results,
             n=n,
             seed=seed,
+            shard=shard,
         )
 
         RESULT_DIR.mkdir(parents=True, exist_ok=True)
-        result_path = RESULT_DIR / f"{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+        result_path = RESULT_DIR / f"{run_id}.json"
         with open(result_path, "w", encoding="utf-8") as f:
-            json.dump(asdict(batch_result), f, indent=4, ensure_ascii=False)
+            json.dump(asdict(batch_result), f, ensure_ascii=False)
         print(f"Results saved to {result_path}")
+        result_store.add_batch(run_id, batch_result)
+        print(f"Results stored as run {run_id} in {result_store.path}")
+        return batch_result
+
+    def estimate_cost(
+        self,
+        model_configs: list[ModelConfig],
+        dataset_names: list[DatasetName],
+        strategies: list[TokenizationStrategy],
+        n: int,
+        seed: int,
+        pilot_n: int = 3,
+        budget: Budget | None = None,
+    ):
+        # The pilot is a prefix of the seeded sample, so with the response cache enabled the full run reuses its responses.
+        estimates: list[CostEstimate] = []
+        for model_config in model_configs:
+            for dataset_name in dataset_names:
+                try:
+                    pilot = self.run(
+                        model_config=model_config, dataset_name=dataset_name, strategies=strategies, n=min(pilot_n, n), seed=seed, budget=budget
+                    )
+                except BudgetExceededError as e:
+                    print(f"Stopping the pilot at {dataset_name} with {model_config}: {e}")
+                    return estimates
+                for strategy in strategies:
+                    dollars = [
+                        r.cached_dollars if r.cached_dollars is not None else r.dollars
+                        for r in (s_to_r[strategy] for s_to_r in pilot.strategy_results if strategy in s_to_r)
+                    ]
+                    if not dollars:
+                        continue
+                    mean_dollars = sum(dollars) / len(dollars)
+                    estimates.append(
+                        CostEstimate(
+                            model=str(model_config),
+                            dataset=dataset_name,
+                            strategy=strategy,
+                            pilot_n=len(dollars),
+                            mean_dollars=mean_dollars,
+                            estimated_dollars=mean_dollars * n,
+                        )
+                    )
+        return estimates
+
+    def resume_batch(self, run_id: str, budget: Budget | None = None):
+        journal = RunJournal(RESULT_DIR / f"{run_id}.jsonl")
+        if journal.header is None:
+            raise FileNotFoundError(f"No journal found for run {run_id} in {RESULT_DIR}")
+        return self.run_batch(
+            model_configs=[ModelConfig(**m) for m in journal.header["model_configs"]],
+            dataset_names=journal.header["dataset_names"],
+            strategies=journal.header["strategies"],
+            n=journal.header["n"],
+            seed=journal.header["seed"],
+            run_id=run_id,
+            budget=budget,
+            shard=tuple(journal.header["shard"]) if journal.header.get("shard") else None,
+            wave_size=journal.header.get("wave_size"),
+        )
+
+    def merge_shards(self, shard_run_ids: list[str], run_id: str | None = None):
+        shards: list[BatchResult] = []
+        for shard_run_id in shard_run_ids:
+            with open(RESULT_DIR / f"{shard_run_id}.json", "r", encoding="utf-8") as f:
+                shards.append(batch_result_from_dict(json.load(f)))
+
+        first = shards[0]
+        count = first.shard[1] if first.shard else 0
+        if sorted(b.shard[0] for b in shards if b.shard and b.shard[1] == count) != list(range(count)) or len(shards) != count:
+            raise ValueError(f"Expected exactly one result per shard 0/{count}..{count - 1}/{count}, got {[b.shard for b in shards]}")
+        for b in shards:
+            if (b.model_config, b.datasets, b.strategies, b.n, b.seed) != (first.model_config, first.datasets, first.strategies, first.n, first.seed):
+                raise ValueError("Shards must come from runs with the same models, datasets, strategies, n and seed")
+        shards.sort(key=lambda b: cast(tuple[int, int], b.shard)[0])
+
+        model_results: dict[str, ModelResult] = {}
+        for model_config in first.model_config:
+            dataset_results: dict[DatasetName, DatasetResult] = {}
+            for dataset_name in first.datasets:
+                parts = [
+                    b.model_results[str(model_config)].dataset_results.get(dataset_name) if str(model_config) in b.model_results else None
+                    for b in shards
+                ]
+                if any(part is None for part in parts):
+                    print(f"Skipping {dataset_name} with {model_config}: missing from at least one shard")
+                    continue
+                if any(cast(DatasetResult, part).stop_reason is not None for part in parts):
+                    raise ValueError(f"Cannot merge adaptive results for {dataset_name} with {model_config}")
+                shard_results = [cast(DatasetResult, part).strategy_results for part in parts]
+                # Undo the tasks[i::N] split so statistics see the tasks in the single-process order.
+                strategy_to_result_list = [shard_results[k % count][k // count] for k in range(sum(len(r) for r in shard_results))]
+                dataset_results[dataset_name] = DatasetResult(
+                    dollars=sum(r.dollars for s_to_r in strategy_to_result_list for r in s_to_r.values()),
+                    summary=self.calculate_summary(first.strategies, strategy_to_result_list),
+                    strategy_results=strategy_to_result_list,
+                )
+            if dataset_results:
+                model_results[str(model_config)] = self.get_model_result(first.strategies, dataset_results)
+
+        if not model_results:
+            return
+        run_id = run_id or datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        batch_result = self.save_batch(
+            run_id=run_id,
+            model_configs=first.model_config,
+            dataset_names=first.datasets,
+            strategies=first.strategies,
+            n=first.n,
+            seed=first.seed,
+            model_results=model_results,
+        )
+        result_store.mark_merged(shard_run_ids, run_id)
+        return batch_result
 
     def aggregate_summaries(self, strategies: list[TokenizationStrategy], summaries: list[ResultSummary]):
         baseline_scores = [s["baseline"].avg_score for s in summaries]
@@ -113,21 +611,86 @@ class Runner:
             avg = sum(scores) / len(scores)
 
             root_summary[strategy] = StrategySummary(
-                avg_score=avg, total_dollars=sum(dollars), delta=avg - baseline_avg if strategy != "baseline" else None
+                avg_score=avg,
+                total_dollars=sum(dollars),
+                delta=avg - baseline_avg if strategy != "baseline" else None,
+                mean_prompt_chars=self.get_mean([s[strategy].mean_prompt_chars for s in summaries]),
+                mean_prompt_tokens=self.get_mean([s[strategy].mean_prompt_tokens for s in summaries]),
+                mean_completion_tokens=self.get_mean([s[strategy].mean_completion_tokens for s in summaries]),
+                mean_reasoning_tokens=self.get_mean([s[strategy].mean_reasoning_tokens for s in summaries]),
+                mean_cached_prompt_tokens=self.get_mean([s[strategy].mean_cached_prompt_tokens for s in summaries]),
             )
         return root_summary
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resume", metavar="RUN_ID", help="Resume an interrupted run from its journal in data/results")
+    parser.add_argument(
+        "--budget", type=float, default=float(os.getenv("RUN_BUDGET", "0")) or None, help="Stop dispatching new requests after this many dollars"
+    )
+    parser.add_argument("--estimate", action="store_true", help="Run a small pilot per (model, dataset, strategy) and print the projected cost")
+    parser.add_argument("--pilot-n", type=int, default=3)
+    parser.add_argument("--batch-api", action="store_true", help="Submit uncached requests as provider batch jobs instead of live calls")
+    parser.add_argument("--run-id", help="Run id to use; with --batch-api, resumes polling the jobs saved in data/batches")
+    parser.add_argument("--shard", type=parse_shard, metavar="i/N", help="Run only tasks i, i+N, i+2N, ... of the seeded sample")
+    parser.add_argument("--merge", nargs="+", metavar="RUN_ID", help="Merge the results of every shard of a run into --run-id")
+    parser.add_argument(
+        "--wave-size",
+        type=int,
+        default=int(os.getenv("RUN_WAVE_SIZE", "0")) or None,
+        help="Dispatch tasks in waves and stop each (model, dataset) once every strategy is decided against baseline; RUN_N becomes n_max",
+    )
+    args = parser.parse_args()
+    if args.wave_size is not None:
+        if args.wave_size <= 0:
+            parser.error("--wave-size must be positive")
+        conflicts = [flag for flag, value in [("--shard", args.shard), ("--batch-api", args.batch_api), ("--estimate", args.estimate)] if value]
+        if conflicts:
+            parser.error(f"--wave-size cannot be combined with {', '.join(conflicts)}")
+
     runner = Runner()
+    budget = Budget(args.budget) if args.budget is not None else None
+    if args.resume:
+        runner.resume_batch(args.resume, budget=budget)
+        raise SystemExit
+    if args.merge:
+        runner.merge_shards(args.merge, run_id=args.run_id)
+        raise SystemExit
     model_name = os.getenv("RUN_MODEL", "google/gemini-3-flash-preview:floor")
     reasoning = cast(Reasoning, os.getenv("RUN_REASONING", "none"))
     n = int(os.getenv("RUN_N", "5"))
     seed = int(os.getenv("RUN_SEED", "0"))
+    model_configs = [ModelConfig(model=model_name, reasoning=reasoning)]
+    dataset_names: list[DatasetName] = ["JWTD"]
+    if args.estimate:
+        estimates = runner.estimate_cost(
+            model_configs=model_configs,
+            dataset_names=dataset_names,
+            strategies=TOKENIZATION_STRATEGIES,
+            n=n,
+            seed=seed,
+            pilot_n=args.pilot_n,
+            budget=budget,
+        )
+        for e in estimates:
+            print(f"{e.model} | {e.dataset} | {e.strategy} | pilot_n={e.pilot_n} | ${e.mean_dollars:.6f}/task | ${e.estimated_dollars:.4f} for n={n}")
+        total = sum(e.estimated_dollars for e in estimates)
+        print(f"Estimated total: ${total:.4f}" + (f" (budget ${args.budget:.4f})" if args.budget is not None else ""))
+        raise SystemExit
+    if args.batch_api:
+        runner.run_batch_api(
+            strategies=TOKENIZATION_STRATEGIES, model_configs=model_configs, dataset_names=dataset_names, n=n, seed=seed, run_id=args.run_id
+        )
+        raise SystemExit
     runner.run_batch(
         strategies=TOKENIZATION_STRATEGIES,
-        model_configs=[ModelConfig(model=model_name, reasoning=reasoning)],
-        dataset_names=["JWTD"],
+        model_configs=model_configs,
+        dataset_names=dataset_names,
         n=n,
         seed=seed,
+        run_id=args.run_id,
+        budget=budget,
+        shard=args.shard,
+        wave_size=args.wave_size,
     )
@@ -0,0 +1,97 @@
+import json
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any
+
+from src.dataset.model import DatasetName
+from src.run.model import ModelConfig
+from src.task.model import TaskResult
+from src.tokenizer import TokenizationStrategy
+
+JournalKey = tuple[str, DatasetName, str, TokenizationStrategy]
+RESUME_KEYS = ["model_configs", "dataset_names", "strategies", "n", "seed", "shard"]
+
+
+class RunJournal:
+    def __init__(self, path: Path):
+        self.path = path
+        self.header: dict[str, Any] | None = None
+        self.results: dict[JournalKey, TaskResult] = {}
+        if path.exists():
+            self.load()
+        self._file = None
+
+    def load(self):
+        end = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                end += len(line)
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record["type"] == "run":
+                    self.header = record
+                elif record["type"] == "result":
+                    result = TaskResult(**record["result"])
+                    self.results[(record["model"], record["dataset"], result.task_id, result.tokenization_strategy)] = result
+        if end < self.path.stat().st_size:
+            # A write cut off by a crash would otherwise swallow the next appended record.
+            with open(self.path, "r+b") as f:
+                f.truncate(end)
+
+    def write(self, record: dict[str, Any]):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    def start(
+        self,
+        model_configs: list[ModelConfig],
+        dataset_names: list[DatasetName],
+        strategies: list[TokenizationStrategy],
+        n: int,
+        seed: int,
+        shard: tuple[int, int] | None = None,
+        wave_size: int | None = None,
+    ):
+        header = {
+            "type": "run",
+            "model_configs": [asdict(m) for m in model_configs],
+            "dataset_names": dataset_names,
+            "strategies": strategies,
+            "n": n,
+            "seed": seed,
+            "shard": shard,
+            "wave_size": wave_size,
+        }
+        if self.header is None:
+            self.header = header
+            self.write(self.header)
+            return
+
+        # The wave size only changes when a run stops, not which tasks it samples, so it may differ on resume.
+        expected = json.loads(json.dumps(header))
+        mismatched = [key for key in RESUME_KEYS if self.header.get(key) != expected[key]]
+        if mismatched:
+            raise ValueError(f"Journal {self.path} was started with different {', '.join(mismatched)}; use a new run id")
+
+    @property
+    def run_id(self):
+        return self.path.stem
+
+    def get(self, model_config: ModelConfig, dataset_name: DatasetName, task_id: str, strategy: TokenizationStrategy):
+        return self.results.get((str(model_config), dataset_name, task_id, strategy))
+
+    def append(self, model_config: ModelConfig, dataset_name: DatasetName, result: TaskResult):
+        self.results[(str(model_config), dataset_name, result.task_id, result.tokenization_strategy)] = result
+        self.write({"type": "result", "model": str(model_config), "dataset": dataset_name, "result": asdict(result)})
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,67 @@
+import asyncio
+import os
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import TypeVar
+
+from src.rate_limiter import RateLimiter, RetryableError, RetryState, get_rate_limiter, run_with_retry_state
+
+T = TypeVar("T")
+
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+
+class ConcurrencyLimiter:
+    def __init__(self, global_limit: int, provider_limit: int, model_limit: int):
+        self.global_limit = global_limit
+        self.provider_limit = provider_limit
+        self.model_limit = model_limit
+        self._executor: ThreadPoolExecutor | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._global = asyncio.Semaphore(global_limit)
+        self._providers: dict[str, asyncio.Semaphore] = {}
+        self._models: dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.global_limit)
+        return self._executor
+
+    @staticmethod
+    def get_provider():
+        # Every model goes through the same OpenAI-compatible endpoint, so they share its quota (e.g. all OpenRouter models).
+        return os.getenv("OPENAI_BASE_URL") or OPENAI_BASE_URL
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._global = asyncio.Semaphore(self.global_limit)
+            self._providers = {}
+            self._models = {}
+
+    @asynccontextmanager
+    async def acquire(self, model: str, rate_limiter: RateLimiter | None = None):
+        self._bind_loop()
+        model_semaphore = self._models.setdefault(model, asyncio.Semaphore(self.model_limit))
+        provider_semaphore = self._providers.setdefault(self.get_provider(), asyncio.Semaphore(self.provider_limit))
+
+        # A throttled model waits for its rate limiter before taking the shared slots, so it cannot starve other models.
+        async with model_semaphore:
+            waited = await rate_limiter.aacquire() if rate_limiter is not None else 0.0
+            async with provider_semaphore, self._global:
+                yield waited
+
+    async def run(self, model: str, fn: Callable[[], T]) -> T:
+        rate_limiter = get_rate_limiter(model)
+        state = RetryState()
+        while True:
+            async with self.acquire(model, rate_limiter) as waited:
+                state.rate_limited_seconds += waited
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(self.executor, run_with_retry_state, state, fn)
+                except RetryableError as e:
+                    wait_time = e.wait_time
+            await asyncio.sleep(wait_time)
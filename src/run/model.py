@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Literal, override
+from typing import Any, Literal, cast, override
 
 from src.dataset.model import DatasetName
 from src.task.model import TaskResult
@@ -7,6 +7,7 @@ from src.tokenizer import TokenizationStrategy
 
 Reasoning = Literal[None, "none", "low", "medium", "high"]
 REASONINGS: list[Reasoning] = [None, "none", "low", "medium", "high"]
+StopReason = Literal["decided", "n_max", "budget"]
 
 
 @dataclass()
@@ -27,6 +28,18 @@ class StrategySummary:
     avg_score: float
     total_dollars: float
     delta: float | None = None
+    ci_low: float | None = None
+    ci_high: float | None = None
+    delta_ci_low: float | None = None
+    delta_ci_high: float | None = None
+    p_value: float | None = None
+    p50_latency_seconds: float | None = None
+    p95_latency_seconds: float | None = None
+    mean_prompt_chars: float | None = None
+    mean_prompt_tokens: float | None = None
+    mean_completion_tokens: float | None = None
+    mean_reasoning_tokens: float | None = None
+    mean_cached_prompt_tokens: float | None = None
 
 
 ResultSummary = dict[TokenizationStrategy, StrategySummary]
@@ -37,6 +50,7 @@ class DatasetResult:
     dollars: float
     summary: ResultSummary
     strategy_results: list[dict[TokenizationStrategy, TaskResult]]
+    stop_reason: StopReason | None = None
 
 
 @dataclass
@@ -53,6 +67,60 @@ class BatchResult:
     strategies: list[TokenizationStrategy]
     dollars: float
     n: int
-    seed: int = 0
     summary: ResultSummary
     model_results: dict[str, ModelResult]
+    seed: int = 0
+    shard: tuple[int, int] | None = None
+
+
+@dataclass
+class CostEstimate:
+    model: str
+    dataset: DatasetName
+    strategy: TokenizationStrategy
+    pilot_n: int
+    mean_dollars: float
+    estimated_dollars: float
+
+
+def parse_shard(value: str) -> tuple[int, int]:
+    index, _, count = value.partition("/")
+    shard = int(index), int(count)
+    if not 0 <= shard[0] < shard[1]:
+        raise ValueError(f"Shard must be i/N with 0 <= i < N, got {value}")
+    return shard
+
+
+def summary_from_dict(data: dict[str, Any]) -> ResultSummary:
+    return {cast(TokenizationStrategy, strategy): StrategySummary(**summary) for strategy, summary in data.items()}
+
+
+def batch_result_from_dict(data: dict[str, Any]):
+    return BatchResult(
+        model_config=[ModelConfig(**m) for m in data["model_config"]],
+        datasets=data["datasets"],
+        strategies=data["strategies"],
+        dollars=data["dollars"],
+        n=data["n"],
+        seed=data.get("seed", 0),
+        shard=tuple(data["shard"]) if data.get("shard") else None,
+        summary=summary_from_dict(data["summary"]),
+        model_results={
+            model: ModelResult(
+                dollars=model_result["dollars"],
+                summary=summary_from_dict(model_result["summary"]),
+                dataset_results={
+                    dataset: DatasetResult(
+                        dollars=dataset_result["dollars"],
+                        summary=summary_from_dict(dataset_result["summary"]),
+                        strategy_results=[
+                            {strategy: TaskResult(**result) for strategy, result in s_to_r.items()} for s_to_r in dataset_result["strategy_results"]
+                        ],
+                        stop_reason=dataset_result.get("stop_reason"),
+                    )
+                    for dataset, dataset_result in model_result["dataset_results"].items()
+                },
+            )
+            for model, model_result in data["model_results"].items()
+        },
+    )
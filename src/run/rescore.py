@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from pathlib import Path
+
+from src.dataset.model import DatasetName
+from src.run.index import RESULT_DIR, Runner
+from src.run.model import BatchResult, batch_result_from_dict
+from src.run.store import result_store
+from src.task.index import TaskRunner
+from src.task.model import Task, TaskResult
+from src.tokenizer import TokenizationStrategy
+
+ScoreItem = tuple[Task, TokenizationStrategy, list[str]]
+
+task_runner = TaskRunner()
+
+
+def evaluate_chunk(items: list[ScoreItem]):
+    return [task_runner.evaluate_many(task, strategy, responses) for task, strategy, responses in items]
+
+
+class Rescorer:
+    runner = Runner()
+
+    def get_tasks(self, dataset_name: DatasetName, results: list[TaskResult]):
+        tasks = {
+            r.task_id: Task(id=r.task_id, type=r.task_type, context=None, question="", options=[], ground_truths=r.ground_truths) for r in results
+        }
+
+        option_ids = list({r.task_id for r in results if r.task_type == "multiple_choice"})
+        if option_ids:
+            for task in self.runner.dataset_loader.load_task_table(dataset_name).get_tasks_by_id(option_ids):
+                tasks[task.id].options = task.options
+        return tasks
+
+    def rescore(self, batch_results: list[BatchResult], max_workers: int, chunk_size: int):
+        groups: dict[tuple[DatasetName, str, TokenizationStrategy], list[TaskResult]] = {}
+        for batch_result in batch_results:
+            for model_result in batch_result.model_results.values():
+                for dataset_name, dataset_result in model_result.dataset_results.items():
+                    for s_to_r in dataset_result.strategy_results:
+                        for strategy, result in s_to_r.items():
+                            groups.setdefault((dataset_name, result.task_id, strategy), []).append(result)
+
+        tasks: dict[tuple[DatasetName, str], Task] = {}
+        dataset_names: set[DatasetName] = {dataset_name for dataset_name, _, _ in groups}
+        for dataset_name in dataset_names:
+            results = [group[0] for (d, _, _), group in groups.items() if d == dataset_name]
+            tasks.update({(dataset_name, task_id): task for task_id, task in self.get_tasks(dataset_name, results).items()})
+
+        keys = list(groups)
+        items: list[ScoreItem] = [
+            (tasks[(d, task_id)], strategy, [r.response for r in groups[(d, task_id, strategy)]]) for d, task_id, strategy in keys
+        ]
+        chunks = [items[i : i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+        if max_workers <= 1 or len(chunks) <= 1:
+            scores = [s for chunk in chunks for s in evaluate_chunk(chunk)]
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                scores = [s for chunk_scores in executor.map(evaluate_chunk, chunks) for s in chunk_scores]
+
+        for key, group_scores in zip(keys, scores):
+            for result, score in zip(groups[key], group_scores):
+                result.evaluation = score
+
+        for batch_result in batch_results:
+            for model_result in batch_result.model_results.values():
+                for dataset_result in model_result.dataset_results.values():
+                    dataset_result.summary = self.runner.calculate_summary(batch_result.strategies, dataset_result.strategy_results)
+                model_result.summary = self.runner.aggregate_summaries(
+                    strategies=batch_result.strategies, summaries=[r.summary for r in model_result.dataset_results.values()]
+                )
+            batch_result.summary = self.runner.aggregate_summaries(
+                strategies=batch_result.strategies, summaries=[m.summary for m in batch_result.model_results.values()]
+            )
+        return batch_results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-run the current evaluators over saved results without calling any model")
+    parser.add_argument("paths", nargs="*", type=Path, help="Result files to rescore (default: every result in data/results)")
+    parser.add_argument("--in-place", action="store_true", help="Overwrite the result files instead of writing *.rescored.json")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=256)
+    args = parser.parse_args()
+
+    paths: list[Path] = args.paths or sorted(p for p in RESULT_DIR.glob("*.json") if not p.name.endswith(".rescored.json"))
+    batch_results: list[BatchResult] = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            batch_results.append(batch_result_from_dict(json.load(f)))
+    old_summaries = [{s: summary.avg_score for s, summary in b.summary.items()} for b in batch_results]
+
+    Rescorer().rescore(batch_results, max_workers=args.workers, chunk_size=args.chunk_size)
+
+    for path, batch_result, old_summary in zip(paths, batch_results, old_summaries):
+        output_path = path if args.in_place else path.with_name(f"{path.stem}.rescored.json")
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(batch_result), f, ensure_ascii=False)
+        # save_batch names result files after their run, so the stored rows of that run get the new scores too.
+        result_store.add_batch(path.stem, batch_result)
+
+        changes = ", ".join(f"{s}: {old_summary[s]:.4f} -> {summary.avg_score:.4f}" for s, summary in batch_result.summary.items())
+        print(f"Rescored {path} -> {output_path} and run {path.stem} in {result_store.path} ({changes})")
@@ -0,0 +1,115 @@
+import os
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Literal
+
+import numpy as np
+
+BOOTSTRAP_RESAMPLES = int(os.getenv("BOOTSTRAP_RESAMPLES", "10000"))
+PERMUTATION_RESAMPLES = int(os.getenv("PERMUTATION_RESAMPLES", "10000"))
+CONFIDENCE_LEVEL = float(os.getenv("CONFIDENCE_LEVEL", "0.95"))
+STATS_SEED = 0
+SEQUENTIAL_MARGIN = float(os.getenv("SEQUENTIAL_MARGIN", "0.05"))
+SEQUENTIAL_MIN_PAIRS = int(os.getenv("SEQUENTIAL_MIN_PAIRS", "30"))
+MAX_BLOCK_ELEMENTS = 1 << 23
+
+
+@dataclass
+class PairedStatistics:
+    ci_low: float
+    ci_high: float
+    delta_ci_low: float | None
+    delta_ci_high: float | None
+    p_value: float | None
+
+
+SequentialOutcome = Literal["different", "equivalent"]
+
+
+@dataclass
+class SequentialDecision:
+    delta: float
+    delta_low: float
+    delta_high: float
+    decision: SequentialOutcome | None
+
+
+def get_block_size(n: int, resamples: int):
+    return max(1, min(resamples, MAX_BLOCK_ELEMENTS // max(1, n)))
+
+
+def bootstrap_means(values: np.ndarray, resamples: int, rng: np.random.Generator):
+    rows, n = values.shape
+    block_size = get_block_size(n, resamples)
+    means = np.empty((rows, resamples))
+    for start in range(0, resamples, block_size):
+        size = min(block_size, resamples - start)
+        indices = rng.integers(0, n, size=(size, n)) + np.arange(size)[:, None] * n
+        counts = np.bincount(indices.ravel(), minlength=size * n).reshape(size, n)
+        means[:, start : start + size] = (counts @ values.T).T / n
+    return means
+
+
+def sign_flip_p_values(diffs: np.ndarray, resamples: int, rng: np.random.Generator):
+    rows, n = diffs.shape
+    observed = np.abs(diffs.mean(axis=1))
+    block_size = get_block_size(n, resamples)
+    exceed = np.zeros(rows, dtype=np.int64)
+    for start in range(0, resamples, block_size):
+        size = min(block_size, resamples - start)
+        signs = rng.integers(0, 2, size=(size, n), dtype=np.int8) * 2 - 1
+        permuted = np.abs(signs @ diffs.T / n)
+        exceed += (permuted >= observed - 1e-12).sum(axis=0)
+    return (exceed + 1) / (resamples + 1)
+
+
+def paired_statistics(scores: np.ndarray, baseline_index: int):
+    rng = np.random.default_rng(STATS_SEED)
+    alpha = (1 - CONFIDENCE_LEVEL) / 2
+    diffs = scores - scores[baseline_index]
+
+    means = bootstrap_means(np.vstack([scores, diffs]), BOOTSTRAP_RESAMPLES, rng)
+    low, high = np.quantile(means, [alpha, 1 - alpha], axis=1)
+    p_values = sign_flip_p_values(diffs, PERMUTATION_RESAMPLES, rng)
+
+    rows = scores.shape[0]
+    return [
+        PairedStatistics(
+            ci_low=float(low[i]),
+            ci_high=float(high[i]),
+            delta_ci_low=float(low[rows + i]) if i != baseline_index else None,
+            delta_ci_high=float(high[rows + i]) if i != baseline_index else None,
+            p_value=float(p_values[i]) if i != baseline_index else None,
+        )
+        for i in range(rows)
+    ]
+
+
+def sequential_decisions(
+    scores: np.ndarray, baseline_index: int, n_looks: int, margin: float = SEQUENTIAL_MARGIN, min_pairs: int = SEQUENTIAL_MIN_PAIRS
+):
+    # Bonferroni spending over the planned looks keeps the error of stopping early within 1 - CONFIDENCE_LEVEL.
+    alpha = (1 - CONFIDENCE_LEVEL) / max(1, n_looks)
+    z = NormalDist().inv_cdf(1 - alpha / 2)
+    diffs = scores - scores[baseline_index]
+    n = diffs.shape[1]
+    means = diffs.mean(axis=1)
+    # Floor the variance at one discordant pair's worth so a run of identical scores cannot look decided after a few tasks.
+    variances = np.maximum(diffs.var(axis=1, ddof=1) if n > 1 else np.full(len(diffs), np.inf), 1 / n)
+    half_widths = z * np.sqrt(variances / n)
+
+    decisions: list[SequentialDecision] = []
+    for mean, half_width in zip(means, half_widths):
+        low, high = float(mean - half_width), float(mean + half_width)
+        decision: SequentialOutcome | None
+        # The normal interval is anti-conservative on a handful of pairs, e.g. three concordant wins already exclude zero.
+        if n < min_pairs:
+            decision = None
+        elif low > 0 or high < 0:
+            decision = "different"
+        elif -margin < low and high < margin:
+            decision = "equivalent"
+        else:
+            decision = None
+        decisions.append(SequentialDecision(delta=float(mean), delta_low=low, delta_high=high, decision=decision))
+    return [d if i != baseline_index else None for i, d in enumerate(decisions)]
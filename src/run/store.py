@@ -0,0 +1,195 @@
+import argparse
+import json
+import sqlite3
+import threading
+import zlib
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+from src.dataset.model import DatasetName
+from src.run.model import BatchResult, ModelConfig, batch_result_from_dict
+from src.task.model import TaskResult
+from src.tokenizer import TokenizationStrategy
+
+STORE_FILE = Path("data/results/results.sqlite")
+RESULT_KEYS = ["run_id", "model", "dataset", "strategy", "task_id"]
+
+
+@dataclass
+class SliceSummary:
+    run_id: str | None
+    model: str | None
+    dataset: str | None
+    strategy: str | None
+    n: int
+    avg_score: float
+    total_dollars: float
+
+
+class ResultStore:
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+
+    @property
+    def connection(self):
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS runs (
+                    run_id TEXT PRIMARY KEY, n INTEGER NOT NULL, seed INTEGER NOT NULL, model_configs TEXT NOT NULL,
+                    datasets TEXT NOT NULL, strategies TEXT NOT NULL, dollars REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS results (
+                    run_id TEXT NOT NULL, model TEXT NOT NULL, dataset TEXT NOT NULL, task_id TEXT NOT NULL, strategy TEXT NOT NULL,
+                    task_type TEXT NOT NULL, evaluation REAL NOT NULL, dollars REAL NOT NULL, record BLOB NOT NULL,
+                    PRIMARY KEY (run_id, model, dataset, task_id, strategy)
+                );
+                CREATE INDEX IF NOT EXISTS results_slice ON results (model, dataset, strategy);
+                CREATE INDEX IF NOT EXISTS results_dataset ON results (dataset, strategy);
+                CREATE INDEX IF NOT EXISTS results_task ON results (dataset, task_id);
+                """
+            )
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(runs)")}
+            if "merged_into" not in columns:
+                self._connection.execute("ALTER TABLE runs ADD COLUMN merged_into TEXT")
+            self._connection.commit()
+        return self._connection
+
+    @staticmethod
+    def compress(result: TaskResult):
+        return zlib.compress(json.dumps(asdict(result), ensure_ascii=False).encode("utf-8"))
+
+    @staticmethod
+    def decompress(record: bytes):
+        return TaskResult(**json.loads(zlib.decompress(record).decode("utf-8")))
+
+    def add_run(
+        self,
+        run_id: str,
+        model_configs: list[ModelConfig],
+        datasets: list[DatasetName],
+        strategies: list[TokenizationStrategy],
+        n: int,
+        seed: int,
+        dollars: float = 0.0,
+    ):
+        with self._lock, self.connection:
+            # An upsert rather than REPLACE, so re-saving a shard keeps its merged_into mark.
+            self.connection.execute(
+                "INSERT INTO runs (run_id, n, seed, model_configs, datasets, strategies, dollars) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                + "ON CONFLICT (run_id) DO UPDATE SET n = excluded.n, seed = excluded.seed, model_configs = excluded.model_configs, "
+                + "datasets = excluded.datasets, strategies = excluded.strategies, dollars = excluded.dollars",
+                (run_id, n, seed, json.dumps([asdict(m) for m in model_configs]), json.dumps(datasets), json.dumps(strategies), dollars),
+            )
+
+    def add_result(self, run_id: str, model: str, dataset: DatasetName, result: TaskResult):
+        row = self.get_row(run_id, model, dataset, result.tokenization_strategy, result)
+        with self._lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", row)
+
+    def add_batch(self, run_id: str, batch_result: BatchResult):
+        self.add_run(
+            run_id,
+            model_configs=batch_result.model_config,
+            datasets=batch_result.datasets,
+            strategies=batch_result.strategies,
+            n=batch_result.n,
+            seed=batch_result.seed,
+            dollars=batch_result.dollars,
+        )
+        rows = [
+            self.get_row(run_id, model, dataset, strategy, r)
+            for model, model_result in batch_result.model_results.items()
+            for dataset, dataset_result in model_result.dataset_results.items()
+            for s_to_r in dataset_result.strategy_results
+            for strategy, r in s_to_r.items()
+        ]
+        with self._lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def mark_merged(self, shard_run_ids: list[str], run_id: str):
+        with self._lock, self.connection:
+            self.connection.executemany(
+                "UPDATE runs SET merged_into = ? WHERE run_id = ?", [(run_id, shard_run_id) for shard_run_id in shard_run_ids]
+            )
+
+    def get_row(self, run_id: str, model: str, dataset: str, strategy: str, result: TaskResult):
+        return (run_id, model, dataset, result.task_id, strategy, result.task_type, result.evaluation, result.dollars, self.compress(result))
+
+    def get_filters(self, filters: dict[str, str | None]):
+        clauses = [f"{key} = ?" for key, value in filters.items() if value is not None]
+        params = [value for value in filters.values() if value is not None]
+        if filters.get("run_id") is None:
+            # Shards that were merged are already counted through their merged run.
+            clauses.append("run_id NOT IN (SELECT run_id FROM runs WHERE merged_into IS NOT NULL)")
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def summarize(
+        self,
+        group_by: list[str],
+        run_id: str | None = None,
+        model: str | None = None,
+        dataset: str | None = None,
+        strategy: str | None = None,
+    ):
+        if any(key not in RESULT_KEYS for key in group_by):
+            raise ValueError(f"group_by must be a subset of {RESULT_KEYS}")
+
+        where, params = self.get_filters({"run_id": run_id, "model": model, "dataset": dataset, "strategy": strategy})
+        columns = ", ".join(group_by)
+        query = f"SELECT {columns + ', ' if columns else ''}COUNT(*), AVG(evaluation), SUM(dollars) FROM results{where}" + (
+            f" GROUP BY {columns} ORDER BY {columns}" if columns else ""
+        )
+        with self._lock:
+            rows = self.connection.execute(query, params).fetchall()
+
+        summaries: list[SliceSummary] = []
+        for row in rows:
+            keys: dict[str, Any] = dict(zip(group_by, row))
+            summaries.append(
+                SliceSummary(
+                    run_id=keys.get("run_id", run_id),
+                    model=keys.get("model", model),
+                    dataset=keys.get("dataset", dataset),
+                    strategy=keys.get("strategy", strategy),
+                    n=row[len(group_by)],
+                    avg_score=row[len(group_by) + 1] or 0.0,
+                    total_dollars=row[len(group_by) + 2] or 0.0,
+                )
+            )
+        return summaries
+
+    def load_results(self, run_id: str | None = None, model: str | None = None, dataset: str | None = None, strategy: str | None = None):
+        where, params = self.get_filters({"run_id": run_id, "model": model, "dataset": dataset, "strategy": strategy})
+        with self._lock:
+            rows = self.connection.execute(f"SELECT record FROM results{where}", params).fetchall()
+        return [self.decompress(row[0]) for row in rows]
+
+
+result_store = ResultStore(STORE_FILE)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Query per-slice summaries across stored runs")
+    parser.add_argument("--import", dest="import_paths", nargs="*", type=Path, default=[], help="Import BatchResult JSON files first")
+    parser.add_argument("--group-by", nargs="*", default=["model", "dataset", "strategy"], choices=RESULT_KEYS)
+    parser.add_argument("--run")
+    parser.add_argument("--model")
+    parser.add_argument("--dataset")
+    parser.add_argument("--strategy")
+    args = parser.parse_args()
+
+    for path in args.import_paths:
+        with open(path, "r", encoding="utf-8") as f:
+            result_store.add_batch(path.stem, batch_result_from_dict(json.load(f)))
+        print(f"Imported {path} as run {path.stem}")
+
+    for summary in result_store.summarize(args.group_by, run_id=args.run, model=args.model, dataset=args.dataset, strategy=args.strategy):
+        labels = " | ".join(str(getattr(summary, key)) for key in args.group_by)
+        print(f"{labels} | n={summary.n} | avg_score={summary.avg_score:.4f} | total_dollars={summary.total_dollars:.4f}")
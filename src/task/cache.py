@@ -0,0 +1,140 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Literal, override
+
+from src.run.model import ModelConfig
+
+CacheMode = Literal["off", "read_write", "read_only"]
+CACHE_MODES: list[CacheMode] = ["off", "read_write", "read_only"]
+
+CACHE_FILE = Path("data/cache/responses.sqlite")
+
+
+@dataclass
+class CachedResponse:
+    text: str
+    reasoning: str | None
+    dollars: float
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    reasoning_tokens: int | None = None
+
+
+class ResponseCache:
+    def __init__(self, path: Path, mode: CacheMode, max_entries: int):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}, expected one of {', '.join(CACHE_MODES)}")
+        self.path = path
+        self.mode: CacheMode = mode
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection: sqlite3.Connection | None = None
+        self._entries: int | None = None
+        self._columns: set[str] = set()
+
+    @property
+    def connection(self):
+        if self._connection is None and self.mode == "read_only":
+            # Shared or checked-in caches may not be writable, so read-only mode never creates or migrates anything.
+            self._connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._columns = {row[1] for row in self._connection.execute("PRAGMA table_info(responses)")}
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                + "model TEXT NOT NULL, reasoning TEXT NOT NULL, prompt_hash TEXT NOT NULL, "
+                + "text TEXT NOT NULL, reasoning_text TEXT, dollars REAL NOT NULL, accessed_at REAL NOT NULL, "
+                + "PRIMARY KEY (model, reasoning, prompt_hash))"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+            columns = {row[1] for row in self._connection.execute("PRAGMA table_info(responses)")}
+            if "usage" not in columns:
+                self._connection.execute("ALTER TABLE responses ADD COLUMN usage TEXT")
+            self._connection.commit()
+            self._columns = columns | {"usage"}
+        return self._connection
+
+    @staticmethod
+    def get_key(model_config: ModelConfig, prompt: str, system: str | None = None, options: dict[str, Any] | None = None):
+        # Generation options change the response (max_tokens and stop_when truncate it); callables can only be keyed on being set.
+        options_key = json.dumps({key: True if callable(value) else value for key, value in (options or {}).items()}, sort_keys=True)
+        content = prompt if system is None else f"{system}\0{prompt}"
+        prompt_hash = hashlib.sha256(f"{options_key}\0{content}".encode("utf-8")).hexdigest()
+        return model_config.model, model_config.reasoning or "", prompt_hash
+
+    def get(self, model_config: ModelConfig, prompt: str, system: str | None = None, options: dict[str, Any] | None = None):
+        if self.mode == "off":
+            return None
+
+        key = self.get_key(model_config, prompt, system, options)
+        with self._lock:
+            # A read-only cache is used as found: it may not exist, be empty, or predate the usage column.
+            connection = self.connection if self.mode != "read_only" or self.path.exists() else None
+            row = None
+            if connection is not None and self._columns:
+                usage = "usage" if "usage" in self._columns else "NULL"
+                row = connection.execute(
+                    f"SELECT text, reasoning_text, dollars, {usage} FROM responses WHERE model = ? AND reasoning = ? AND prompt_hash = ?", key
+                ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            if self.mode == "read_write":
+                self.connection.execute(
+                    "UPDATE responses SET accessed_at = ? WHERE model = ? AND reasoning = ? AND prompt_hash = ?", (time.time(), *key)
+                )
+                self.connection.commit()
+        return CachedResponse(text=row[0], reasoning=row[1], dollars=row[2], **json.loads(row[3] or "{}"))
+
+    def put(self, model_config: ModelConfig, prompt: str, response: CachedResponse, system: str | None = None, options: dict[str, Any] | None = None):
+        if self.mode != "read_write":
+            return
+
+        with self._lock:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (model, reasoning, prompt_hash, text, reasoning_text, dollars, accessed_at, usage) "
+                + "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    *self.get_key(model_config, prompt, system, options),
+                    response.text,
+                    response.reasoning,
+                    response.dollars,
+                    time.time(),
+                    json.dumps(
+                        {
+                            "prompt_tokens": response.prompt_tokens,
+                            "completion_tokens": response.completion_tokens,
+                            "reasoning_tokens": response.reasoning_tokens,
+                        }
+                    ),
+                ),
+            )
+            # REPLACE may overwrite instead of insert, so the running count is only trusted until it reaches the cap.
+            if self._entries is None or self._entries >= self.max_entries:
+                entries: int = self.connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            else:
+                entries = self._entries + 1
+
+            if entries > self.max_entries:
+                self.connection.execute(
+                    "DELETE FROM responses WHERE rowid IN (SELECT rowid FROM responses ORDER BY accessed_at LIMIT ?)",
+                    (entries - self.max_entries,),
+                )
+                entries = self.max_entries
+            self._entries = entries
+            self.connection.commit()
+
+    @override
+    def __str__(self) -> str:
+        return f"Response cache ({self.mode}): {self.hits} hits, {self.misses} misses"
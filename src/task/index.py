@@ -1,22 +1,41 @@
+import asyncio
+import os
 import re
 from collections import Counter
 from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, cast
 
-from ai_sdk import generate_text, openai
-from ai_sdk.generate_text import GenerateTextResult
 from dotenv import load_dotenv
 
+from src.run.budget import Budget
+from src.run.limiter import ConcurrencyLimiter
 from src.run.model import ModelConfig
-from src.task.model import NIL_LABELS, Task, TaskConfig, TaskResult, TaskType
-from src.tokenizer import TokenizationStrategy, Tokenizer
+from src.task.cache import CACHE_FILE, CachedResponse, CacheMode, ResponseCache
+from src.task.model import NIL_LABELS, PromptLayout, Task, TaskConfig, TaskResult, TaskType, parse_prompt_layout
+from src.tokenizer import MemoCache, TokenizationStrategy, Tokenizer
+
+if TYPE_CHECKING:
+    from ai_sdk.generate_text import GenerateTextResult
+    from ai_sdk.providers.openai import OpenAIModel
 
 load_dotenv()
 
+LIST_MARKER_PATTERN = re.compile(r"^\d+[.)]\s*")
+CORRECTION_PAIR_PATTERN = re.compile(r"^(.+?)\s*->\s*(.+)$")
+COMPLETE_INTEGER_PATTERN = re.compile(r"^\s*\d+\s")
+
 tokenizer = Tokenizer()
+evaluation_cache = MemoCache[tuple[Any, ...], Any]("Evaluation cache", int(os.getenv("EVALUATION_CACHE_SIZE", "65536")))
+response_cache = ResponseCache(
+    path=CACHE_FILE, mode=cast(CacheMode, os.getenv("RUN_CACHE", "read_write")), max_entries=int(os.getenv("RUN_CACHE_MAX_ENTRIES", "1000000"))
+)
 
 
 class TaskRunner:
-    configs: dict[TaskType, TaskConfig] = {
+    prompt_layout: PromptLayout = parse_prompt_layout(os.getenv("RUN_PROMPT_LAYOUT", "combined"))
+    stream_stop = os.getenv("RUN_STREAM_STOP", "1") != "0"
+    models: dict[str, "OpenAIModel"] = {}
+    configs: dict[TaskType, TaskConfig[Any]] = {
         "multiple_choice": TaskConfig(
             get_instruction_prompt=lambda task, strategy: (
                 "Answer with exactly one of the provided choices, and nothing else. Do not use markdown or extra formatting."
@@ -27,15 +46,10 @@ class TaskRunner:
                 + "Choices:\n"
                 + "\n".join(tokenizer.tokenize(option, strategy) for option in task.options)
             ),
-            evaluate=lambda task, strategy, response: (
-                1.0
-                if any(
-                    tokenizer.normalize(response, strategy) == tokenizer.normalize(option, strategy)
-                    and task.options.index(option) in task.ground_truths
-                    for option in task.options
-                )
-                else 0.0
-            ),
+            prepare_evaluation=lambda task, strategy: TaskRunner.get_correct_choices(task.options, task.ground_truths, strategy),
+            evaluate=lambda correct_choices, strategy, response: 1.0 if tokenizer.normalize(response, strategy) in correct_choices else 0.0,
+            max_tokens=128,
+            stop_when=lambda task, strategy, text: TaskRunner.is_complete_choice(task.options, strategy, text),
         ),
         "nli": TaskConfig(
             get_instruction_prompt=lambda task, strategy: (
@@ -48,14 +62,10 @@ class TaskRunner:
                 + "Choices:\n"
                 + "\n".join(label for label in NIL_LABELS)
             ),
-            evaluate=lambda task, strategy, response: (
-                1.0
-                if any(
-                    tokenizer.normalize(response, strategy) == tokenizer.normalize(label, strategy) and NIL_LABELS.index(label) in task.ground_truths
-                    for label in NIL_LABELS
-                )
-                else 0.0
-            ),
+            prepare_evaluation=lambda task, strategy: TaskRunner.get_correct_choices(NIL_LABELS, task.ground_truths, strategy),
+            evaluate=lambda correct_choices, strategy, response: 1.0 if tokenizer.normalize(response, strategy) in correct_choices else 0.0,
+            max_tokens=16,
+            stop_when=lambda task, strategy, text: TaskRunner.is_complete_choice(NIL_LABELS, strategy, text),
         ),
         "extraction": TaskConfig(
             get_instruction_prompt=lambda task, strategy: (
@@ -64,10 +74,12 @@ class TaskRunner:
             get_task_prompt=lambda task, strategy: (
                 f"Context: {tokenizer.tokenize(task.context or '', strategy)}\n" + f"Question: {tokenizer.tokenize(task.question, strategy)}"
             ),
-            evaluate=lambda task, strategy, response: max(
-                (TaskRunner.compute_f1(tokenizer.normalize(response, strategy), tokenizer.normalize(str(gt), strategy)) for gt in task.ground_truths),
+            prepare_evaluation=lambda task, strategy: [Counter(tokenizer.normalize(str(gt), strategy)) for gt in task.ground_truths],
+            evaluate=lambda ground_truth_counters, strategy, response: max(
+                (TaskRunner.compute_f1_from_counters(Counter(tokenizer.normalize(response, strategy)), gt) for gt in ground_truth_counters),
                 default=0.0,
             ),
+            max_tokens=256,
         ),
         "correction": TaskConfig(
             get_instruction_prompt=lambda task, strategy: "\n".join(
@@ -88,70 +100,124 @@ class TaskRunner:
                 ]
             ),
             get_task_prompt=lambda task, strategy: f"Text: {tokenizer.tokenize(task.question, strategy)}",
-            evaluate=lambda task, strategy, response: TaskRunner.correction_score(task, strategy, response),
+            prepare_evaluation=lambda task, strategy: TaskRunner.parse_correction_pairs("\n".join(str(gt) for gt in task.ground_truths), strategy),
+            evaluate=lambda ground_truth_pairs, strategy, response: TaskRunner.correction_f1(
+                TaskRunner.parse_correction_pairs(response, strategy), ground_truth_pairs
+            ),
+            max_tokens=1024,
         ),
         "char_counting": TaskConfig(
             get_instruction_prompt=lambda task, strategy: (
                 'Count the number of "Character" in "Text". Answer with a single number only. Do not use markdown or extra formatting.'
             ),
             get_task_prompt=lambda task, strategy: f"Text: {tokenizer.tokenize(task.context or '', strategy)}\n" + f"Character: {task.question}",
-            evaluate=lambda task, strategy, response: (
+            prepare_evaluation=lambda task, strategy: [int(gt) for gt in task.ground_truths],
+            evaluate=lambda ground_truth_counts, strategy, response: (
                 max(
-                    (max(0.0, 1.0 - abs(int(response.strip()) - int(gt)) / int(gt)) if int(gt) > 0 else (1.0 if int(response.strip()) == 0 else 0.0))
-                    for gt in task.ground_truths
+                    (max(0.0, 1.0 - abs(int(response.strip()) - gt) / gt) if gt > 0 else (1.0 if int(response.strip()) == 0 else 0.0))
+                    for gt in ground_truth_counts
                 )
                 if response.strip().isdigit()
                 else 0.0
             ),
+            max_tokens=16,
+            stop_when=lambda task, strategy, text: COMPLETE_INTEGER_PATTERN.match(text) is not None,
         ),
     }
 
     @staticmethod
-    def correction_score(task: Task, strategy: TokenizationStrategy, response: str):
+    def get_correct_choices(choices: list[str], ground_truths: list[str] | list[int], strategy: TokenizationStrategy):
+        first_indices: dict[str, int] = {}
+        for i, choice in enumerate(choices):
+            first_indices.setdefault(choice, i)
+        return frozenset(tokenizer.normalize(choice, strategy) for choice, i in first_indices.items() if i in ground_truths)
+
+    @staticmethod
+    def is_complete_choice(choices: list[str], strategy: TokenizationStrategy, text: str):
+        # The answer must be followed by whitespace, otherwise "東京" may still become "東京タワー".
+        # A prefix of a longer choice is not complete either, e.g. "Neutral" vs "Neutral (unsure)".
+        if not text[-1:].isspace():
+            return False
+        normalized = tokenizer.normalize_uncached(text, strategy)
+        normalized_choices = [tokenizer.normalize(choice, strategy) for choice in choices]
+        return normalized in normalized_choices and not any(c != normalized and c.startswith(normalized) for c in normalized_choices)
+
+    @staticmethod
+    def parse_correction_pairs(text: str, strategy: TokenizationStrategy):
         def normalize_part(text: str):
             text = text.strip().replace("（", "(").replace("）", ")").replace("\u3000", " ")
             text = text.strip("「」『』\"'`")
             return tokenizer.normalize(text, strategy).lower()
 
-        def parse_pairs(text: str):
-            pairs: set[tuple[str, str]] = set()
-            for raw_line in text.splitlines():
-                line = raw_line.strip()
-                if not line:
-                    continue
-                if line.startswith("- "):
-                    line = line[2:].strip()
-                line = re.sub(r"^\d+[.)]\s*", "", line)
-                match = re.compile(r"^(.+?)\s*->\s*(.+)$").match(line)
-                if not match:
-                    continue
-                typo = normalize_part(match.group(1))
-                correction = normalize_part(match.group(2))
-                if typo and correction and typo != correction:
-                    pairs.add((typo, correction))
-            return pairs
-
-        ground_truth_pairs = parse_pairs("\n".join(str(gt) for gt in task.ground_truths))
-        predicted_pairs = parse_pairs(response)
+        pairs: set[tuple[str, str]] = set()
+        for raw_line in text.splitlines():
+            line = raw_line.strip()
+            if not line:
+                continue
+            if line.startswith("- "):
+                line = line[2:].strip()
+            line = LIST_MARKER_PATTERN.sub("", line)
+            match = CORRECTION_PAIR_PATTERN.match(line)
+            if not match:
+                continue
+            typo = normalize_part(match.group(1))
+            correction = normalize_part(match.group(2))
+            if typo and correction and typo != correction:
+                pairs.add((typo, correction))
+        return pairs
 
+    @staticmethod
+    def correction_f1(predicted_pairs: set[tuple[str, str]], ground_truth_pairs: set[tuple[str, str]]):
         true_positives = len(predicted_pairs & ground_truth_pairs)
         precision = true_positives / len(predicted_pairs) if predicted_pairs else (1.0 if not ground_truth_pairs else 0.0)
         recall = true_positives / len(ground_truth_pairs) if ground_truth_pairs else 1.0
         return (2 * precision * recall) / (precision + recall) if precision + recall > 0 else 0.0
 
+    @staticmethod
+    def correction_score(task: Task, strategy: TokenizationStrategy, response: str):
+        ground_truth_pairs = TaskRunner.parse_correction_pairs("\n".join(str(gt) for gt in task.ground_truths), strategy)
+        return TaskRunner.correction_f1(TaskRunner.parse_correction_pairs(response, strategy), ground_truth_pairs)
+
     @staticmethod
     def compute_f1(prediction: str, ground_truth: str):
-        prediction_tokens = list(prediction)
-        ground_truth_tokens = list(ground_truth)
-        common = Counter(prediction_tokens) & Counter(ground_truth_tokens)
+        return TaskRunner.compute_f1_from_counters(Counter(prediction), Counter(ground_truth))
+
+    @staticmethod
+    def compute_f1_from_counters(prediction: Counter[str], ground_truth: Counter[str]):
+        common = prediction & ground_truth
         num_same = sum(common.values())
         if num_same == 0:
             return 0.0
-        precision = 1.0 * num_same / len(prediction_tokens)
-        recall = 1.0 * num_same / len(ground_truth_tokens)
+        precision = 1.0 * num_same / prediction.total()
+        recall = 1.0 * num_same / ground_truth.total()
         return (2 * precision * recall) / (precision + recall)
 
-    def get_cost_from_response(self, res: GenerateTextResult):
+    def get_evaluation_artifacts(self, task: Task, strategy: TokenizationStrategy):
+        key = (task.type, task.id, strategy, repr(task.ground_truths), tuple(task.options))
+        artifacts = evaluation_cache.get(key)
+        if artifacts is None:
+            artifacts = self.configs[task.type].prepare_evaluation(task, strategy)
+            evaluation_cache.put(key, artifacts)
+        return artifacts
+
+    def evaluate(self, task: Task, strategy: TokenizationStrategy, response: str):
+        return self.configs[task.type].evaluate(self.get_evaluation_artifacts(task, strategy), strategy, response)
+
+    def evaluate_many(self, task: Task, strategy: TokenizationStrategy, responses: list[str]):
+        config = self.configs[task.type]
+        artifacts = self.get_evaluation_artifacts(task, strategy)
+        return [config.evaluate(artifacts, strategy, response) for response in responses]
+
+    def get_model(self, model: str):
+        # Building a client costs tens of milliseconds of CPU (SSL context, connection pool), so reuse one per model.
+        if model not in self.models:
+            # ai_sdk and openai dominate import time, so they load with the first model; cached and rescore runs never pay for them.
+            from src.patch_sdk import create_model
+
+            self.models[model] = create_model(model)
+        return self.models[model]
+
+    def get_cost_from_response(self, res: "GenerateTextResult"):
         dollars = 0.0
         if res.raw_response and hasattr(res.raw_response, "usage") and res.raw_response.usage:
             retrieved_cost = getattr(res.raw_response.usage, "cost", None)
@@ -162,24 +228,153 @@ class TaskRunner:
                     pass
         return dollars
 
-    def run_strategy(self, model_config: ModelConfig, strategy: TokenizationStrategy, task: Task):
+    def get_usage_tokens(self, res: "GenerateTextResult", *path: str) -> int | None:
+        value = getattr(res.raw_response, "usage", None)
+        for attribute in path:
+            value = getattr(value, attribute, None)
+        return int(value) if isinstance(value, (int, float)) else None
+
+    def get_prompts(self, task: Task, strategy: TokenizationStrategy):
         config = self.configs[task.type]
+        instruction_prompt = config.get_instruction_prompt(task, strategy)
         task_prompt = config.get_task_prompt(task, strategy)
-        user_prompt = config.get_instruction_prompt(task, strategy) + "\n\n" + task_prompt
+        if self.prompt_layout == "system":
+            return task_prompt, instruction_prompt, task_prompt
+        return task_prompt, None, instruction_prompt + "\n\n" + task_prompt
 
-        res = generate_text(model=openai(model_config.model), reasoning=model_config.reasoning, prompt=user_prompt)
+    def pre_tokenize(self, tasks: list[Task], strategies: list[TokenizationStrategy]):
+        strings = list(dict.fromkeys(string for task in tasks for string in (task.context or "", task.question, *task.options)))
+        for strategy in strategies:
+            tokenizer.tokenize_many(strings, strategy)
 
+    def get_generation_options(self, model_config: ModelConfig, strategy: TokenizationStrategy, task: Task):
+        config = self.configs[task.type]
+        options: dict[str, Any] = {}
+        # With reasoning enabled, max_tokens also bounds the hidden reasoning and would cut answers off.
+        if config.max_tokens is not None and model_config.reasoning == "none":
+            options["max_tokens"] = config.max_tokens
+        if config.stop_when is not None and self.stream_stop:
+            stop_when = config.stop_when
+            options["stop_when"] = lambda text: stop_when(task, strategy, text)
+        return options
+
+    def get_batch_options(self, model_config: ModelConfig, strategy: TokenizationStrategy, task: Task):
+        # Batch jobs cannot be cancelled mid-generation, so only the output cap applies.
+        return {key: value for key, value in self.get_generation_options(model_config, strategy, task).items() if key != "stop_when"}
+
+    def get_cached_response(self, res: "GenerateTextResult"):
+        return CachedResponse(
+            text=res.text,
+            reasoning=res.reasoning,
+            dollars=self.get_cost_from_response(res),
+            prompt_tokens=self.get_usage_tokens(res, "prompt_tokens"),
+            completion_tokens=self.get_usage_tokens(res, "completion_tokens"),
+            reasoning_tokens=self.get_usage_tokens(res, "completion_tokens_details", "reasoning_tokens"),
+        )
+
+    def get_result(
+        self,
+        strategy: TokenizationStrategy,
+        task: Task,
+        prompts: tuple[str, str | None, str],
+        response: CachedResponse,
+        res: "GenerateTextResult | None" = None,
+    ):
+        task_prompt, system_prompt, user_prompt = prompts
+        provider_metadata = (res.provider_metadata if res is not None else None) or {}
         return TaskResult(
             task_id=task.id,
             task_type=task.type,
             tokenization_strategy=strategy,
             task_prompt=task_prompt,
-            response=res.text,
-            dollars=self.get_cost_from_response(res),
-            evaluation=config.evaluate(task, strategy, res.text),
+            response=response.text,
+            # A replayed response costs nothing now; what it cost when first generated is kept for estimates.
+            dollars=response.dollars if res is not None else 0.0,
+            evaluation=self.evaluate(task, strategy, response.text),
             ground_truths=task.ground_truths,
-            reasoning=res.reasoning,
+            reasoning=response.reasoning,
+            cached=res is None,
+            cached_dollars=response.dollars if res is None else None,
+            prompt_layout=self.prompt_layout,
+            cached_prompt_tokens=self.get_usage_tokens(res, "prompt_tokens_details", "cached_tokens") if res is not None else None,
+            # Only the successful request; waiting for the rate limiter and retrying are reported separately.
+            latency_seconds=provider_metadata.get("request_seconds"),
+            retries=provider_metadata.get("retries", 0),
+            rate_limited_seconds=provider_metadata.get("rate_limited_seconds", 0.0),
+            retry_seconds=provider_metadata.get("retry_seconds", 0.0),
+            prompt_chars=len(system_prompt or "") + len(user_prompt),
+            prompt_tokens=response.prompt_tokens,
+            completion_tokens=response.completion_tokens,
+            reasoning_tokens=response.reasoning_tokens,
+            stopped_early=res is not None and res.finish_reason == "stop_when",
+        )
+
+    def get_cached_result(self, model_config: ModelConfig, strategy: TokenizationStrategy, task: Task):
+        prompts = self.get_prompts(task, strategy)
+        cached = response_cache.get(model_config, prompts[2], system=prompts[1], options=self.get_batch_options(model_config, strategy, task))
+        return self.get_result(strategy, task, prompts, cached) if cached is not None else None
+
+    def run_strategy(self, model_config: ModelConfig, strategy: TokenizationStrategy, task: Task, budget: Budget | None = None):
+        prompts = self.get_prompts(task, strategy)
+        _, system_prompt, user_prompt = prompts
+        options = self.get_generation_options(model_config, strategy, task)
+
+        cached = response_cache.get(model_config, user_prompt, system=system_prompt, options=options)
+        if cached is not None:
+            return self.get_result(strategy, task, prompts, cached)
+
+        if budget is not None:
+            budget.check()
+        model = self.get_model(model_config.model)
+        from ai_sdk import generate_text
+
+        res = generate_text(
+            model=model,
+            reasoning=model_config.reasoning,
+            system=system_prompt,
+            prompt=user_prompt,
+            **options,
+        )
+        response = self.get_cached_response(res)
+        if budget is not None:
+            budget.charge(response.dollars)
+        response_cache.put(model_config, user_prompt, response, system=system_prompt, options=options)
+        return self.get_result(strategy, task, prompts, response, res=res)
+
+    def get_batch_request(self, model_config: ModelConfig, strategy: TokenizationStrategy, task: Task, custom_id: str):
+        from src.patch_sdk import get_reasoning_options
+
+        _, system_prompt, user_prompt = self.get_prompts(task, strategy)
+        messages = ([{"role": "system", "content": system_prompt}] if system_prompt else []) + [{"role": "user", "content": user_prompt}]
+        options = self.get_batch_options(model_config, strategy, task)
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": model_config.model,
+                "messages": messages,
+                **get_reasoning_options(model_config.model, model_config.reasoning),
+                **options,
+            },
+        }
+
+    def get_batch_result(self, model_config: ModelConfig, strategy: TokenizationStrategy, task: Task, body: dict[str, Any]):
+        from ai_sdk.generate_text import GenerateTextResult
+        from openai.types.chat import ChatCompletion
+
+        prompts = self.get_prompts(task, strategy)
+        completion = ChatCompletion.model_validate(body)
+        choice = completion.choices[0]
+        res = GenerateTextResult(
+            text=choice.message.content or "",
+            finish_reason=choice.finish_reason,
+            reasoning=getattr(choice.message, "reasoning_content", None) or getattr(choice.message, "reasoning", None),
+            raw_response=completion,
         )
+        response = self.get_cached_response(res)
+        response_cache.put(model_config, prompts[2], response, system=prompts[1], options=self.get_batch_options(model_config, strategy, task))
+        return self.get_result(strategy, task, prompts, response, res=res)
 
     def run(self, model_config: ModelConfig, strategies: list[TokenizationStrategy], task: Task):
         with ThreadPoolExecutor() as executor:
@@ -191,3 +386,19 @@ class TaskRunner:
             )
         strategy_to_result: dict[TokenizationStrategy, TaskResult] = {r.tokenization_strategy: r for r in task_results}
         return strategy_to_result
+
+    async def arun_strategy(
+        self, model_config: ModelConfig, strategy: TokenizationStrategy, task: Task, limiter: ConcurrencyLimiter, budget: Budget | None = None
+    ):
+        return await limiter.run(
+            model_config.model, lambda: self.run_strategy(model_config=model_config, strategy=strategy, task=task, budget=budget)
+        )
+
+    async def arun(
+        self, model_config: ModelConfig, strategies: list[TokenizationStrategy], task: Task, limiter: ConcurrencyLimiter, budget: Budget | None = None
+    ):
+        task_results = await asyncio.gather(
+            *(self.arun_strategy(model_config=model_config, strategy=strategy, task=task, limiter=limiter, budget=budget) for strategy in strategies)
+        )
+        strategy_to_result: dict[TokenizationStrategy, TaskResult] = {r.tokenization_strategy: r for r in task_results}
+        return strategy_to_result
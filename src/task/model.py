@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import Callable, Literal
+from typing import Callable, Generic, Literal, TypeVar, cast
 
 from src.tokenizer import TokenizationStrategy
 
@@ -8,6 +8,18 @@ TASK_TYPES: list[TaskType] = ["multiple_choice", "nli", "extraction", "correctio
 
 NIL_LABELS = ["Entailment", "Contradiction", "Neutral"]
 
+PromptLayout = Literal["combined", "system"]
+PROMPT_LAYOUTS: list[PromptLayout] = ["combined", "system"]
+
+
+def parse_prompt_layout(value: str) -> PromptLayout:
+    if value not in PROMPT_LAYOUTS:
+        raise ValueError(f"Unknown prompt layout {value!r}, expected one of {', '.join(PROMPT_LAYOUTS)}")
+    return cast(PromptLayout, value)
+
+
+T = TypeVar("T")
+
 
 @dataclass
 class Task:
@@ -20,10 +32,13 @@ class Task:
 
 
 @dataclass
-class TaskConfig:
+class TaskConfig(Generic[T]):
     get_instruction_prompt: Callable[[Task, TokenizationStrategy], str]
     get_task_prompt: Callable[[Task, TokenizationStrategy], str]
-    evaluate: Callable[[Task, TokenizationStrategy, str], float]
+    prepare_evaluation: Callable[[Task, TokenizationStrategy], T]
+    evaluate: Callable[[T, TokenizationStrategy, str], float]
+    max_tokens: int | None = None
+    stop_when: Callable[[Task, TokenizationStrategy, str], bool] | None = None
 
 
 @dataclass
@@ -37,3 +52,16 @@ class TaskResult:
     dollars: float
     evaluation: float
     reasoning: str | None
+    cached: bool = False
+    cached_dollars: float | None = None
+    prompt_layout: PromptLayout = "combined"
+    cached_prompt_tokens: int | None = None
+    latency_seconds: float | None = None
+    retries: int = 0
+    rate_limited_seconds: float = 0.0
+    retry_seconds: float = 0.0
+    prompt_chars: int = 0
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    reasoning_tokens: int | None = None
+    stopped_early: bool = False
@@ -1,25 +1,98 @@
+import os
 import threading
-from typing import Literal
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Generic, Literal, TypeVar, override
 
-from fugashi import Tagger
+if TYPE_CHECKING:
+    from fugashi import Tagger
 
 TokenizationStrategy = Literal["baseline", "character", "morphology"]
 
 
 TOKENIZATION_STRATEGIES: list[TokenizationStrategy] = ["baseline", "character", "morphology"]
 
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+class MemoCache(Generic[K, V]):
+    def __init__(self, name: str, max_size: int):
+        self.name = name
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._items: OrderedDict[K, V] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> V | None:
+        with self._lock:
+            value = self._items.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key: K, value: V):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            if len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    @override
+    def __str__(self) -> str:
+        total = self.hits + self.misses
+        hit_rate = self.hits / total if total else 0.0
+        return f"{self.name}: {self.hits} hits, {self.misses} misses ({hit_rate:.1%} hit rate, {len(self._items)}/{self.max_size} entries)"
+
 
 class Tokenizer:
-    def __init__(self):
+    def __init__(self, max_workers: int | None = None, chunk_size: int = 256, cache_size: int | None = None):
         self._local = threading.local()
+        cache_size = cache_size if cache_size is not None else int(os.getenv("TOKENIZER_CACHE_SIZE", "65536"))
+        self.tokenize_cache = MemoCache[tuple[str, TokenizationStrategy], str]("Tokenize cache", cache_size)
+        self.normalize_cache = MemoCache[tuple[str, TokenizationStrategy], str]("Normalize cache", cache_size)
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self._executor: ProcessPoolExecutor | None = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
 
     @property
-    def tagger(self) -> Tagger:
+    def tagger(self) -> "Tagger":
         if not hasattr(self._local, "tagger"):
+            # Only the morphology strategy needs MeCab, so the import is deferred to the first tagger.
+            from fugashi import Tagger
+
             self._local.tagger = Tagger("-Owakati")
         return self._local.tagger
 
     def tokenize(self, string: str, strategy: TokenizationStrategy):
+        if strategy == "baseline":
+            return string
+
+        tokenized = self.tokenize_cache.get((string, strategy))
+        if tokenized is None:
+            tokenized = self.tokenize_uncached(string, strategy)
+            self.tokenize_cache.put((string, strategy), tokenized)
+        return tokenized
+
+    def tokenize_uncached(self, string: str, strategy: TokenizationStrategy):
         if strategy == "baseline":
             return string
         elif strategy == "character":
@@ -27,6 +100,19 @@ class Tokenizer:
         elif strategy == "morphology":
             return self.de_tokenize_morphology(string)
 
+    def tokenize_many(self, strings: list[str], strategy: TokenizationStrategy) -> list[str]:
+        if strategy != "morphology" or self.max_workers <= 1 or len(strings) <= self.chunk_size:
+            return [self.tokenize(string, strategy) for string in strings]
+
+        results = {string: self.tokenize_cache.get((string, strategy)) for string in strings}
+        misses = [string for string, tokenized in results.items() if tokenized is None]
+        chunks = [misses[i : i + self.chunk_size] for i in range(0, len(misses), self.chunk_size)]
+        tokenized_chunks = self.executor.map(_tokenize_chunk, chunks, [strategy] * len(chunks))
+        for string, tokenized in zip(misses, (tokenized for chunk in tokenized_chunks for tokenized in chunk)):
+            results[string] = tokenized
+            self.tokenize_cache.put((string, strategy), tokenized)
+        return [results[string] or "" for string in strings]
+
     def de_tokenize_character(self, string: str):
         return " ".join(list(string))
 
@@ -34,12 +120,29 @@ class Tokenizer:
         return self.tagger.parse(string).strip()
 
     def normalize(self, s: str, strategy: TokenizationStrategy):
+        normalized = self.normalize_cache.get((s, strategy))
+        if normalized is None:
+            normalized = self.normalize_uncached(s, strategy)
+            self.normalize_cache.put((s, strategy), normalized)
+        return normalized
+
+    def normalize_uncached(self, s: str, strategy: TokenizationStrategy):
         s = s.replace("**", "").replace("__", "")
         if strategy == "baseline":
             return s.strip()
         return s.replace(" ", "").strip()
 
 
+_process_tokenizer: Tokenizer | None = None
+
+
+def _tokenize_chunk(strings: list[str], strategy: TokenizationStrategy):
+    global _process_tokenizer
+    if _process_tokenizer is None:
+        _process_tokenizer = Tokenizer(max_workers=1, cache_size=0)
+    return [_process_tokenizer.tokenize_uncached(string, strategy) for string in strings]
+
+
 if __name__ == "__main__":
     tokenizer = Tokenizer()
     print(tokenizer.de_tokenize_morphology("これはテストです。"))
@@ -0,0 +1,101 @@
+from types import SimpleNamespace
+from typing import Any
+
+from ai_sdk import generate_text
+from ai_sdk.providers.openai import OpenAIModel
+from openai.types.chat import ChatCompletionChunk
+
+import src.patch_sdk as _
+from src.task.index import COMPLETE_INTEGER_PATTERN, TaskRunner
+
+
+def make_chunk(content: str | None = None, finish_reason: str | None = None, usage: dict[str, int] | None = None):
+    choices = [] if content is None and finish_reason is None else [{"index": 0, "delta": {"content": content}, "finish_reason": finish_reason}]
+    return ChatCompletionChunk.model_validate(
+        {"id": "chunk", "object": "chat.completion.chunk", "created": 0, "model": "mock", "choices": choices, **({"usage": usage} if usage else {})}
+    )
+
+
+class FakeStream:
+    def __init__(self, chunks: list[ChatCompletionChunk]):
+        self.chunks = chunks
+        self.read = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args: object):
+        self.closed = True
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+
+def make_model(chunks: list[ChatCompletionChunk]):
+    streams: list[FakeStream] = []
+
+    def create(**kwargs: Any):
+        streams.append(FakeStream(chunks))
+        return streams[-1]
+
+    model = OpenAIModel("mock/model", api_key="mock")
+    model._client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))  # type: ignore[assignment]
+    return model, streams
+
+
+def test_stop_mid_chunk():
+    # The answer completes inside the second chunk, which also carries the start of an explanation.
+    chunks = [
+        make_chunk("1"),
+        make_chunk("2\n\nExplanation"),
+        make_chunk(": counted"),
+        make_chunk(finish_reason="stop"),
+        make_chunk(usage={"prompt_tokens": 5, "completion_tokens": 4, "total_tokens": 9}),
+    ]
+    model, streams = make_model(chunks)
+    result = generate_text(model=model, prompt="Count", stop_when=lambda text: COMPLETE_INTEGER_PATTERN.match(text) is not None)
+
+    assert result.text == "12\n", result.text
+    assert result.finish_reason == "stop_when", result.finish_reason
+    assert result.usage is None or result.usage.total_tokens == 0, result.usage
+    assert streams[0].read == 2 and streams[0].closed, (streams[0].read, streams[0].closed)
+
+
+def test_stop_mid_chunk_choice():
+    chunks = [make_chunk("Neu"), make_chunk("tral\nBecause"), make_chunk(finish_reason="stop")]
+    model, streams = make_model(chunks)
+    choices = ["Entailment", "Contradiction", "Neutral"]
+    result = generate_text(model=model, prompt="Choose", stop_when=lambda text: TaskRunner.is_complete_choice(choices, "baseline", text))
+
+    assert result.text == "Neutral\n", result.text
+    assert result.finish_reason == "stop_when", result.finish_reason
+    assert streams[0].read == 2 and streams[0].closed, (streams[0].read, streams[0].closed)
+
+
+def test_no_stop():
+    chunks = [
+        make_chunk("1"),
+        make_chunk("2"),
+        make_chunk(finish_reason="stop"),
+        make_chunk(usage={"prompt_tokens": 5, "completion_tokens": 2, "total_tokens": 7}),
+    ]
+    model, streams = make_model(chunks)
+    result = generate_text(model=model, prompt="Count", stop_when=lambda text: False)
+
+    assert result.text == "12", result.text
+    assert result.finish_reason == "stop", result.finish_reason
+    assert result.usage is not None and result.usage.total_tokens == 7, result.usage
+    assert streams[0].read == len(chunks), streams[0].read
+
+
+def main() -> None:
+    for test in [test_stop_mid_chunk, test_stop_mid_chunk_choice, test_no_stop]:
+        test()
+        print(f"{test.__name__}: ok")
+
+
+if __name__ == "__main__":
+    main()